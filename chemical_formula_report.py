@@ -3,7 +3,7 @@ import os
 import re
 import requests
 import sys
-from moss_dump_analyzer import read_en_article_text
+from moss_dump_analyzer import read_en_article_text, register_check
 from wikitext_util import wikitext_to_plaintext, get_main_body_wikitext
 
 # This script finds all instances of known chemical formulas which do
@@ -146,9 +146,12 @@ def dump_results():
         print(line)
 
 
+register_check("chemical_formulas", chem_formula_check, add_tuples_to_results, dump_results)
+
+
 if __name__ == '__main__':
     print("Running chem_formula_check...", file=sys.stderr)
     # Run time: ~1h 15 m (8-core parallel)
-    read_en_article_text(chem_formula_check, process_result_callback=add_tuples_to_results, parallel="incremental")
+    read_en_article_text(chem_formula_check, process_result_callback=add_tuples_to_results, parallel="chunked")
     dump_results()
     print("Done", file=sys.stderr)
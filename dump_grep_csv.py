@@ -16,6 +16,11 @@ from moss_dump_analyzer import read_en_article_text
 
 FIND_RE = re.compile(sys.argv[1])
 
+# Plain strings can be searched for in article bytes before decoding
+PREFILTER_RE = None
+if re.escape(sys.argv[1]) == sys.argv[1]:
+    PREFILTER_RE = re.compile(re.escape(sys.argv[1].encode("utf-8")))
+
 
 def grep_page(article_title, article_text):
     for article_line in article_text.splitlines():
@@ -25,4 +30,4 @@ def grep_page(article_title, article_text):
 
 
 if __name__ == "__main__":
-    read_en_article_text(grep_page, parallel="incremental")
+    read_en_article_text(grep_page, parallel="sharded", prefilter_re=PREFILTER_RE)
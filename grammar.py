@@ -26,7 +26,7 @@ from english_grammar import (enwiktionary_cat_to_pos,
                              phrase_structures,
                              closed_lexicon,
                              vocab_overrides)
-from wikitext_util import wikitext_to_plaintext, get_main_body_wikitext, blockquote_re
+from wikitext_util import wikitext_to_plaintext, get_main_body_wikitext, get_main_body_view_paragraphs, blockquote_re
 
 
 mysql_connection = mysql.connector.connect(user='beland',
@@ -120,12 +120,12 @@ def check_english(wikitext, title):
     # Ignore bad grammar in quotations and poems
     wikitext = blockquote_re.sub("✂", wikitext)
 
-    plaintext = get_main_body_wikitext(wikitext_to_plaintext(wikitext), ignore_nonprose=True)
+    plaintext = wikitext_to_plaintext(wikitext)
     sentences = []
 
     # Tokenizing paragraphs individually helps prevent NLTK from
     # getting confused by some situations, like list items.
-    paragraphs = plaintext.split("\n")
+    paragraphs = get_main_body_view_paragraphs(plaintext, "prose")
     for paragraph in paragraphs:
         words_in_paragraph = nltk.word_tokenize(paragraph)
         if len(words_in_paragraph) > 500:
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+# Word sets stored in a file that can be mapped into memory and
+# queried in place, so loading is nearly instant and all processes
+# share the same pages instead of each building a Python set.
+#
+# File layout:
+#  header: magic, 20-byte signature of the sources it was built from
+#    (see lexicons.py), slot count, word count
+#  slots: open-addressing hash table (linear probing) of 32-bit
+#    offsets into the string table, plus one; 0 means empty
+#  string table: each word in UTF-8 followed by a newline
+
+from array import array
+import mmap
+import os
+import struct
+import zlib
+
+WORD_SET_MAGIC = b"MOSSWST2"
+WORD_SET_HEADER = struct.Struct("<8s20sQQ")
+
+# Maximum fraction of slots used; lookups of missing words get slow
+# as this approaches 1.
+MAX_LOAD_FACTOR = 0.67
+
+
+def write_word_set(filename, words, signature=b""):
+    words = sorted(words)
+    slot_count = 1
+    while slot_count * MAX_LOAD_FACTOR < len(words):
+        slot_count *= 2
+    slot_mask = slot_count - 1
+
+    slots = array("I", bytes(4 * slot_count))
+    strings = []
+    string_offset = 0
+    for word in words:
+        word_bytes = word.encode("utf-8")
+        slot = zlib.crc32(word_bytes) & slot_mask
+        while slots[slot]:
+            slot = (slot + 1) & slot_mask
+        slots[slot] = string_offset + 1
+        strings.append(word_bytes + b"\n")
+        string_offset += len(word_bytes) + 1
+    if string_offset >= 2 ** 32:
+        raise Exception(f"Too many words for {filename}")
+
+    # Write and rename so readers never see a partial file
+    tmp_filename = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_filename, "wb") as word_set_file:
+        word_set_file.write(WORD_SET_HEADER.pack(WORD_SET_MAGIC, signature, slot_count, len(words)))
+        slots.tofile(word_set_file)
+        for word_bytes in strings:
+            word_set_file.write(word_bytes)
+    os.replace(tmp_filename, filename)
+
+
+# Returns None if filename is missing or not a word set file
+def read_word_set_signature(filename):
+    try:
+        with open(filename, "rb") as word_set_file:
+            header = word_set_file.read(WORD_SET_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < WORD_SET_HEADER.size:
+        return None
+    (magic, signature, slot_count, word_count) = WORD_SET_HEADER.unpack(header)
+    if magic != WORD_SET_MAGIC:
+        return None
+    return signature
+
+
+# Returns an opaque value to pass to word_set_contains() and
+# word_set_words()
+def open_word_set(filename):
+    with open(filename, "rb") as word_set_file:
+        mapped = mmap.mmap(word_set_file.fileno(), 0, access=mmap.ACCESS_READ)
+    (magic, signature, slot_count, word_count) = WORD_SET_HEADER.unpack_from(mapped, 0)
+    if magic != WORD_SET_MAGIC:
+        raise Exception(f"{filename} is not a word set file")
+    slots_end = WORD_SET_HEADER.size + 4 * slot_count
+    slots = memoryview(mapped)[WORD_SET_HEADER.size:slots_end].cast("I")
+    return (mapped, slots, slot_count - 1, slots_end - 1)
+
+
+def word_set_contains(word_set, word):
+    (mapped, slots, slot_mask, strings_start) = word_set
+    if "\n" in word:
+        return False
+    word_bytes = word.encode("utf-8") + b"\n"
+    slot = zlib.crc32(word_bytes[:-1]) & slot_mask
+    while True:
+        offset = slots[slot]
+        if not offset:
+            return False
+        string_offset = strings_start + offset
+        if mapped[string_offset:string_offset + len(word_bytes)] == word_bytes:
+            return True
+        slot = (slot + 1) & slot_mask
+
+
+# Generates all the words in the set, in sorted order
+def word_set_words(word_set):
+    (mapped, slots, slot_mask, strings_start) = word_set
+    offset = strings_start + 1
+    while offset < len(mapped):
+        end_offset = mapped.find(b"\n", offset)
+        yield mapped[offset:end_offset].decode("utf-8")
+        offset = end_offset + 1
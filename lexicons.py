@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+# Word lists used by spell.py, word_categorizer.py, and
+# moss_not_english.py, compiled from the downloaded title lists into
+# word set files (see lexicon_file.py) so they don't have to be
+# re-read and re-tokenized by every run.  Also the spelling suggestion
+# index for word_categorizer.py (see suggestion_index.py), which is
+# built from the english_words lexicon.
+#
+# USAGE (from update_downloads_parallel4.sh and 5.sh):
+#  venv/bin/python3 lexicons.py [LEXICON_NAME ...]
+# where LEXICON_NAME is a key of LEXICONS, or "suggestions".
+#
+# Each file records a signature of its source files (name, size, and
+# modification time) and LEXICON_VERSION; get_lexicon() rebuilds the
+# file first if the signature doesn't match.
+
+import hashlib
+import os
+import re
+from string import punctuation
+import sys
+try:
+    from lexicon_file import open_word_set, read_word_set_signature, word_set_words, write_word_set
+    from suggestion_index import open_suggestion_index, read_suggestion_index_signature, write_suggestion_index
+except ImportError:
+    from .lexicon_file import open_word_set, read_word_set_signature, word_set_words, write_word_set
+    from .suggestion_index import open_suggestion_index, read_suggestion_index_signature, write_suggestion_index
+
+BULK_DIR = "/var/local/moss/bulk-wikipedia"
+
+# Increase when changing how any lexicon is built
+LEXICON_VERSION = 1
+
+REQUESTED_SPECIES_FILES = [
+    f"{BULK_DIR}/Wikispecies:Requested_articles",
+    f"{BULK_DIR}/Before_2019",
+    f"{BULK_DIR}/2020",
+    f"{BULK_DIR}/2021",
+]
+
+# Edit distance 3 roughly doubles the size of the index over 2
+SUGGESTION_MAX_EDIT_DISTANCE = 3
+SUGGESTION_PREFIX_LENGTH = 7
+SUGGESTION_INDEX_FILE = f"{BULK_DIR}/suggestions-english_words.bin"
+
+punctuation_re = re.compile(r"[ " + punctuation + r"]")
+word_re = re.compile(r"[\w']+")
+# Same as az_re in word_categorizer.py
+suggestion_word_re = re.compile(r"^[a-z']+$", flags=re.I)
+
+loaded_lexicons = {}
+loaded_suggestion_index = None
+
+
+# -- Build functions: list of source filenames -> set of words --
+
+def add_spell_tokens(words, line):
+    line = line.replace("_", " ")
+    line = line.strip().lower()
+
+    # Mostly splitting on " ", but also ":", etc.
+    words.update(title_word for title_word in punctuation_re.split(line) if title_word)
+
+    # Re-parse splitting only on " " to make sure forms like
+    # "'s" get added (for compatibility with the NLTK
+    # tokenizer)
+    words.update(title_word for title_word in line.split(" ") if title_word)
+
+
+def build_spell_words(filenames):
+    words = set()
+
+    # First file is the moss For_Wiktionary page, which lists words
+    # queued to be added to Wiktionary
+    with open(filenames[0], "r") as moss_html_file:
+        moss_html = moss_html_file.read()
+        queued_matches = re.findall('"https://en.wiktionary.org/wiki/(.*?)"', moss_html)
+        if not queued_matches:
+            raise Exception("Empty Wiktionary queue; regex broken?")
+        for queued_match in queued_matches:
+            add_spell_tokens(words, queued_match)
+
+    for filename in filenames[1:]:
+        with open(filename, "r") as title_list:
+            for line in title_list:
+                add_spell_tokens(words, line)
+    return words
+
+
+def build_lines(filenames):
+    words = set()
+    for filename in filenames:
+        with open(filename, "r") as title_list:
+            words.update(line.strip() for line in title_list)
+    return words
+
+
+def build_species_words(filenames):
+    words = set()
+    for filename in filenames:
+        with open(filename, "r") as title_list:
+            for line in title_list:
+                line = line.replace("_", " ").strip()
+                words.update(word_re.findall(line))
+    return words
+
+
+def build_transliterations(filenames):
+    words = set()
+    for filename in filenames:
+        with open(filename, "r") as title_list:
+            words.update(line.strip().split("\t")[1] for line in title_list
+                         if "\t" in line.strip() and "_" not in line)
+    return words
+
+
+# Values are (source filenames, build function)
+LEXICONS = {
+    "spell": ([f"{BULK_DIR}/For_Wiktionary",
+               f"{BULK_DIR}/enwiktionary-latest-all-titles-in-ns0",
+               f"{BULK_DIR}/enwiki-latest-all-titles-in-ns0",
+               f"{BULK_DIR}/specieswiki-latest-all-titles-in-ns0"]
+              + REQUESTED_SPECIES_FILES
+              + [f"{BULK_DIR}/Old_case_notes"],
+              build_spell_words),
+    "all_wiktionaries": ([f"{BULK_DIR}/titles_all_wiktionaries_uniq.txt"], build_lines),
+    "english_words": ([f"{BULK_DIR}/english_words_only.txt"], build_lines),
+    "species_words": ([f"{BULK_DIR}/specieswiki-latest-all-titles-in-ns0"] + REQUESTED_SPECIES_FILES,
+                      build_species_words),
+    "transliterations": ([f"{BULK_DIR}/transliterations.txt"], build_transliterations),
+}
+
+
+def get_lexicon_filename(name):
+    return f"{BULK_DIR}/lexicon-{name}.bin"
+
+
+def get_lexicon_signature(name):
+    (filenames, build_function) = LEXICONS[name]
+    signature = hashlib.sha1(f"{LEXICON_VERSION}\t{name}".encode("utf-8"))
+    for filename in filenames:
+        file_stat = os.stat(filename)
+        signature.update(f"\t{filename}\t{file_stat.st_size}\t{file_stat.st_mtime_ns}".encode("utf-8"))
+    return signature.digest()
+
+
+def build_lexicon(name):
+    (filenames, build_function) = LEXICONS[name]
+    signature = get_lexicon_signature(name)
+    words = build_function(filenames)
+    write_word_set(get_lexicon_filename(name), words, signature)
+    print(f"Wrote {len(words)} words to {get_lexicon_filename(name)}", file=sys.stderr)
+
+
+def is_lexicon_current(name):
+    return read_word_set_signature(get_lexicon_filename(name)) == get_lexicon_signature(name)
+
+
+# Returns a word set for use with lexicon_file.word_set_contains().
+# Call before forking, so child processes don't each rebuild a stale
+# lexicon.
+def get_lexicon(name):
+    if name not in loaded_lexicons:
+        if not is_lexicon_current(name):
+            print(f"Lexicon {name} missing or out of date; rebuilding...", file=sys.stderr)
+            build_lexicon(name)
+        loaded_lexicons[name] = open_word_set(get_lexicon_filename(name))
+    return loaded_lexicons[name]
+
+
+# -- Requested species --
+
+requested_species_title_re = re.compile(r'title="((?:en|w):[^"]*)"')
+
+
+# Returns the set of link titles like "en:Article title" and
+# "w:Article title" in the downloaded Wikispecies:Requested_articles
+# pages.  Checking an article title against this gives the same
+# answer as searching the HTML for 'title="en:Article title"', without
+# scanning megabytes of HTML per article.
+def get_requested_species_titles(filenames=REQUESTED_SPECIES_FILES):
+    titles = set()
+    for filename in filenames:
+        with open(filename, "r") as requested_species_file:
+            titles.update(requested_species_title_re.findall(requested_species_file.read()))
+    return titles
+
+
+# -- Spelling suggestion index --
+
+def get_suggestion_index_signature():
+    signature = hashlib.sha1(f"{LEXICON_VERSION}\tsuggestions\t{SUGGESTION_MAX_EDIT_DISTANCE}\t{SUGGESTION_PREFIX_LENGTH}".encode("utf-8"))
+    signature.update(get_lexicon_signature("english_words"))
+    return signature.digest()
+
+
+def build_suggestion_index():
+    signature = get_suggestion_index_signature()
+    words = [word for word in word_set_words(get_lexicon("english_words")) if suggestion_word_re.match(word)]
+    write_suggestion_index(SUGGESTION_INDEX_FILE, words, SUGGESTION_MAX_EDIT_DISTANCE, SUGGESTION_PREFIX_LENGTH, signature)
+    print(f"Indexed {len(words)} words in {SUGGESTION_INDEX_FILE}", file=sys.stderr)
+
+
+def is_suggestion_index_current():
+    return read_suggestion_index_signature(SUGGESTION_INDEX_FILE) == get_suggestion_index_signature()
+
+
+# Returns an index for use with
+# suggestion_index.get_suggestion_candidates().  Call before forking,
+# like get_lexicon().
+def get_suggestion_index():
+    global loaded_suggestion_index
+    if loaded_suggestion_index is None:
+        if not is_suggestion_index_current():
+            print("Suggestion index missing or out of date; rebuilding...", file=sys.stderr)
+            build_suggestion_index()
+        loaded_suggestion_index = open_suggestion_index(SUGGESTION_INDEX_FILE)
+    return loaded_suggestion_index
+
+
+if __name__ == '__main__':
+    for lexicon_name in sys.argv[1:] or list(LEXICONS) + ["suggestions"]:
+        if lexicon_name == "suggestions":
+            if is_suggestion_index_current():
+                print("Suggestion index is up to date", file=sys.stderr)
+            else:
+                build_suggestion_index()
+        elif is_lexicon_current(lexicon_name):
+            print(f"Lexicon {lexicon_name} is up to date", file=sys.stderr)
+        else:
+            build_lexicon(lexicon_name)
@@ -3,6 +3,7 @@
 # venv/bin/python3 -m mtprof moss_check_style_by_line.py
 
 # Usage: venv/bin/python3 moss_check_style_by_line.py REDIRECTS_FILE.CSV
+# (When imported by moss_single_pass.py, DEFAULT_REDIRECTS_FILE is used.)
 
 # Run time (commit af4ead3, 4 types of complaint): ~2 hours, 8-core parallel
 
@@ -10,10 +11,15 @@ from pprint import pformat
 import re
 import sys
 import traceback
-from moss_dump_analyzer import read_en_article_text
+from moss_dump_analyzer import read_en_article_text, register_check
+
+DEFAULT_REDIRECTS_FILE = "/var/local/moss/bulk-wikipedia/enwiki-redirects.csv"
 
 print("Loading redirects...", file=sys.stderr)
-redirect_filename = sys.argv[1]
+if __name__ == "__main__":
+    redirect_filename = sys.argv[1]
+else:
+    redirect_filename = DEFAULT_REDIRECTS_FILE
 redirect_dict = {}
 for redirect_pair in open(redirect_filename, "r"):
     (redirect_from, redirect_to) = redirect_pair.split("\t")
@@ -2412,5 +2418,8 @@ TO:"$1 $2"
 """
 
 
+register_check("style_by_line", check_style_by_line)
+
+
 if __name__ == "__main__":
-    read_en_article_text(check_style_by_line, parallel="incremental")
+    read_en_article_text(check_style_by_line, parallel="chunked")
@@ -3,18 +3,109 @@
 # http://dumps.wikimedia.org/backup-index.html
 # http://meta.wikimedia.org/wiki/Data_dumps
 
+from collections import Counter
+import contextlib
 import datetime
+import glob
+import hashlib
+import io
+import json
+import mmap
 import multiprocessing
+import multiprocessing.util
+import os
+import pickle
+import psutil
 import re
+import sqlite3
+import struct
 import sys
+import threading
+import time
 import traceback
+import wikitext_util
+import zstandard
 
 # Runtime: ~1.5 hours (with a simple callback, single-threaded)
 
 CPU_COUNT = multiprocessing.cpu_count()
 DEFAULT_CSV_FILE = "/var/local/moss/bulk-wikipedia/enwiki-articles-no-redir.csv"
+DEFAULT_ARTICLE_FILE = "/var/local/moss/bulk-wikipedia/enwiki-articles-no-redir.zst"
 PAGE_RE = re.compile(r"^.*(<page.*?</page>).*$", flags=re.MULTILINE+re.DOTALL)
 
+# For parallel="incremental".  Articles are submitted to the pool
+# only while fewer than this many are queued or being checked, so
+# memory use is bounded no matter how far child processes fall behind.
+INCREMENTAL_MAX_IN_FLIGHT = 2000
+INCREMENTAL_REPORT_INTERVAL = 100000
+
+# For parallel="chunked".  Chunks of articles are capped by total
+# article text size rather than count, since article lengths vary so
+# much.  maxtasksperchild counts chunks, which average several hundred
+# articles.
+CHUNK_BYTES = 4 * 1024 * 1024
+CHUNKED_MAX_IN_FLIGHT = CPU_COUNT * 4
+CHUNKED_MAXTASKSPERCHILD = 100
+
+# For parallel="sharded". Many more shards than CPUs so that the
+# shards containing very long articles don't leave other cores idle at
+# the end of the run, and so results stream back to the parent
+# steadily.
+SHARDS_PER_CPU = 64
+SHARD_READ_SIZE = 1024 * 1024
+
+# Article container written by xml_to_csv.py: a sequence of frames,
+# each a 4-byte length followed by a zstd frame that decompresses to
+# records of (title length, text length, title, text).  Its index has
+# the same columns as the CSV index, but with the offset and length of
+# the frame holding each article.
+CONTAINER_SUFFIX = ".zst"
+CONTAINER_FRAME_HEADER = struct.Struct("<I")
+CONTAINER_RECORD_HEADER = struct.Struct("<II")
+
+# Set in the parent before forking so children can find them without
+# pickling for every shard (or chunk)
+shard_callback_function = None
+shard_keep_article_results = False
+shard_previous_results_file = None
+previous_results_db = None
+
+# Called in child processes after each shard (or chunk), or when they
+# exit with parallel=True or "incremental", since child processes
+# don't run atexit handlers.  Add more with
+# register_child_flush_function() before calling
+# read_en_article_text().
+child_flush_functions = [wikitext_util.flush_derived_text_db]
+
+# Set MOSS_PROFILE to the name of a JSON file to get a summary of
+# where the time went in each read_en_article_text() run: seconds
+# spent in each phase (timed with profile_phase(); phases can nest)
+# and counters (from count_profile_event()), for each process and in
+# total, plus articles per second.  Child processes save theirs next
+# to that file (after each shard or chunk, or when they exit) for the
+# parent to merge.  When MOSS_PROFILE isn't
+# set, profile_phase() returns a shared do-nothing context manager,
+# so calls can be left in hot code.
+PROFILE_FILE = os.environ.get("MOSS_PROFILE")
+null_profile_phase = contextlib.nullcontext()
+
+# For this process only; cleared in child processes after forking.
+# Phases map to [seconds, count].
+profile_phases = {}
+profile_counters = Counter()
+profile_pid = None
+
+# Reports register themselves here when imported, so that
+# moss_single_pass.py can run any combination of them with one read
+# of the article CSV.  Values are (article_callback, result_callback,
+# dump_callback).
+registered_checks = {}
+check_output_files = {}
+
+# Set by read_en_article_text() from record_files: open files by the
+# tag that starts a record line
+record_output_files = {}
+
 
 def print_result(result):
     # Print from parent process to avoid race conditions
@@ -22,17 +113,155 @@ def print_result(result):
         print(result)
 
 
+# -- Profiling --
+
+def get_profile_data():
+    global profile_phases
+    global profile_counters
+    global profile_pid
+    if profile_pid != os.getpid():
+        profile_phases = {}
+        profile_counters = Counter()
+        profile_pid = os.getpid()
+    return (profile_phases, profile_counters)
+
+
+def profile_phase(phase):
+    if not PROFILE_FILE:
+        return null_profile_phase
+    return timed_profile_phase(phase)
+
+
+@contextlib.contextmanager
+def timed_profile_phase(phase):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        (phases, counters) = get_profile_data()
+        phase_totals = phases.setdefault(phase, [0.0, 0])
+        phase_totals[0] += time.perf_counter() - start_time
+        phase_totals[1] += 1
+
+
+def count_profile_event(counter_name, count=1):
+    if PROFILE_FILE:
+        get_profile_data()[1][counter_name] += count
+
+
+def get_profile_part_filename(pid):
+    return f"{PROFILE_FILE}.{pid}.part"
+
+
+# Runs in child processes (see child_flush_functions).  Totals are
+# for the life of the process, so each flush replaces the last.
+def flush_profile_data():
+    if not PROFILE_FILE:
+        return
+    (phases, counters) = get_profile_data()
+    part_filename = get_profile_part_filename(os.getpid())
+    with open(f"{part_filename}.tmp", "w") as part_file:
+        json.dump({"phases": phases, "counters": counters}, part_file)
+    os.replace(f"{part_filename}.tmp", part_filename)
+
+
+child_flush_functions.append(flush_profile_data)
+
+
+def get_articles_per_second(counters, seconds):
+    if not seconds:
+        return None
+    return round(counters.get("articles", 0) / seconds, 1)
+
+
+# Merges what child processes saved with this process's numbers and
+# writes the summary to PROFILE_FILE
+def write_profile_summary(wall_seconds):
+    (phases, counters) = get_profile_data()
+    processes = {"parent": {"phases": phases, "counters": counters}}
+    for part_filename in glob.glob(glob.escape(PROFILE_FILE) + ".*.part"):
+        with open(part_filename, "r") as part_file:
+            processes["worker " + part_filename.split(".")[-2]] = json.load(part_file)
+        os.remove(part_filename)
+
+    total_phases = {}
+    total_counters = Counter()
+    for process in processes.values():
+        for (phase, (seconds, count)) in process["phases"].items():
+            phase_totals = total_phases.setdefault(phase, [0.0, 0])
+            phase_totals[0] += seconds
+            phase_totals[1] += count
+        total_counters.update(process["counters"])
+        # Per process, relative to time spent checking articles
+        process["articles_per_second"] = get_articles_per_second(process["counters"],
+                                                                 process["phases"].get("check", [0.0])[0])
+
+    summary = {
+        "wall_seconds": round(wall_seconds, 3),
+        "articles_per_second": get_articles_per_second(total_counters, wall_seconds),
+        "phases": {phase: {"seconds": round(seconds, 3), "count": count}
+                   for (phase, (seconds, count)) in sorted(total_phases.items())},
+        "counters": dict(sorted(total_counters.items())),
+        "processes": processes,
+    }
+    with open(PROFILE_FILE, "w") as profile_file:
+        json.dump(summary, profile_file, indent=2)
+    print(f"Wrote profile to {PROFILE_FILE}", file=sys.stderr)
+
+
+def check_article(callback_function, article_title, article_text):
+    count_profile_event("articles")
+    with profile_phase("check"):
+        return callback_function(article_title, article_text)
+
+
 # which_articles selects articles by first character in the title. It
 # can be "ALL", "BEFORE_A", a capital letter A through Z, or "AFTER_Z"
 # (or any leading character you wish to select on)
+#
+# With parallel="sharded", results_file saves the result of
+# callback_function (and anything it printed) for every article, and
+# previous_results_file reuses them from a previous run for articles
+# whose text hasn't changed since, instead of calling
+# callback_function again.
+#
+# Also with parallel="sharded", record_files sorts what articles print
+# by type: it maps a tag (the text before the first tab of a line, like
+# "@" or "!Q") to the file that gets the lines with that tag, so
+# post-processing can read just the lines it needs instead of
+# searching all the output.  Other lines go to stdout.
+#
+# Also with parallel="sharded", prefilter_re is a bytes regex;
+# articles whose UTF-8 text doesn't match it are skipped without being
+# decoded.
+#
+# filename can be the article CSV or the article container; both are
+# written by xml_to_csv.py.
+#
+# With parallel="incremental" or "chunked", max_in_flight overrides
+# INCREMENTAL_MAX_IN_FLIGHT (articles) or CHUNKED_MAX_IN_FLIGHT
+# (chunks).
 def read_en_article_text(callback_function,
-                         filename=DEFAULT_CSV_FILE,
+                         filename=DEFAULT_ARTICLE_FILE,
                          parallel=False,
                          process_result_callback=print_result,
-                         which_articles="ALL"):
+                         which_articles="ALL",
+                         results_file=None,
+                         previous_results_file=None,
+                         prefilter_re=None,
+                         max_in_flight=None,
+                         record_files=None):
+    global shard_callback_function
     if not filename:
         # Necessary backstop for dump_grep_regex.py
-        filename = DEFAULT_CSV_FILE
+        filename = DEFAULT_ARTICLE_FILE
+    if (results_file or previous_results_file or prefilter_re or record_files) and parallel != "sharded":
+        raise Exception("Saving and reusing article results, prefilter_re, and record_files need parallel=\"sharded\"")
+    start_time = time.perf_counter()
+    if PROFILE_FILE:
+        # From an earlier run that didn't finish
+        for part_filename in glob.glob(glob.escape(PROFILE_FILE) + ".*.part"):
+            os.remove(part_filename)
     if parallel:
         # Shares parent data with children without copying
         multiprocessing.set_start_method("fork")
@@ -43,45 +272,237 @@ def read_en_article_text(callback_function,
             #
             # callback_function will get only one argument: (article_title, article_text)
 
-            with multiprocessing.Pool(CPU_COUNT) as pool:
-                results = pool.imap(callback_function,
+            shard_callback_function = callback_function
+            with multiprocessing.Pool(CPU_COUNT, initializer=init_pool_child) as pool:
+                results = pool.imap(check_article_params,
                                     page_generator_fast(filename, which_articles),
                                     chunksize=10000)
                 pool.close()
                 pool.join()
                 [process_result_callback(result) for result in results]
-        elif parallel == "incremental":
+        elif parallel in ("incremental", "chunked"):
             # Processes results incrementally, before processing too
             # many. Slower but uses less memory than parallel=True if
             # results are large.
             #
+            # "chunked" sends lists of articles to child processes
+            # and gets lists of results back, to save a round trip
+            # per article.  process_result_callback still gets one
+            # result at a time.
+            #
             # callback_function will get two arguments: article_title, article_text
+            articles = page_generator_fast(filename, which_articles)
+            if parallel == "chunked":
+                shard_callback_function = callback_function
+                tasks = ((process_chunk, [chunk]) for chunk in chunk_generator(articles, CHUNK_BYTES))
+                max_in_flight = max_in_flight or CHUNKED_MAX_IN_FLIGHT
+                maxtasksperchild = CHUNKED_MAXTASKSPERCHILD
+            else:
+                tasks = ((check_article, [callback_function, article_title, article_text])
+                         for (article_title, article_text) in articles)
+                max_in_flight = max_in_flight or INCREMENTAL_MAX_IN_FLIGHT
+                maxtasksperchild = 50000
 
             # maxtasksperchild is here for aggressive garbage
             # collection of child processes; needed to prevent
             # moss_readability_check children from growing without
             # bound (matters when running with 8GB RAM on 8 cores).
-            with multiprocessing.Pool(CPU_COUNT, maxtasksperchild=50000) as pool:
+            initializer = None if parallel == "chunked" else init_pool_child
+            with multiprocessing.Pool(CPU_COUNT, maxtasksperchild=maxtasksperchild, initializer=initializer) as pool:
+                # Article text isn't garbage collected until its
+                # result has been passed to process_result_callback,
+                # so each submitted article (or chunk) holds a slot
+                # until then.  Callbacks run one at a time on the
+                # pool's result handler thread.
+                in_flight = threading.BoundedSemaphore(max_in_flight)
+                finished_count = 0
+
+                # Raising on the result handler thread would kill it,
+                # and nothing would release in_flight again, so errors
+                # are saved for this thread to raise
+                errors = []
+
+                def result_callback(result):
+                    nonlocal finished_count
+                    try:
+                        with profile_phase("results"):
+                            if parallel == "chunked":
+                                for article_result in result:
+                                    process_result_callback(article_result)
+                            else:
+                                process_result_callback(result)
+                    except Exception as error:
+                        errors.append(error)
+                    finally:
+                        finished_count += 1
+                        in_flight.release()
+
+                def error_callback(error):
+                    errors.append(error)
+                    in_flight.release()
+
                 count = 0
-                for (article_title, article_text) in page_generator_fast(filename, which_articles):
-                    result = pool.apply_async(callback_function,
-                                              args=[article_title, article_text],
-                                              callback=process_result_callback,
-                                              error_callback=parallel_error)
+                for (task_function, task_args) in tasks:
+                    in_flight.acquire()
+                    if errors:
+                        break
+                    pool.apply_async(task_function,
+                                     args=task_args,
+                                     callback=result_callback,
+                                     error_callback=error_callback)
                     count += 1
-                    if count % 25000 == 0:
-                        # Avoid using all available memory; article text
-                        # isn't garbage collected until the callback is
-                        # complete. (Not sure if it's queued requests
-                        # waiting for child processes to start them, or
-                        # results from child processes waiting for the
-                        # parent to service them.)
-                        result.wait()
+                    if count % INCREMENTAL_REPORT_INTERVAL == 0:
+                        print_pool_status(count, count - finished_count)
+                if errors:
+                    pool.terminate()
+                else:
+                    # Without this, leaving the with block would
+                    # terminate the pool with the last tasks still in
+                    # flight
+                    pool.close()
+                    pool.join()
+            if errors:
+                parallel_error(errors[0])
+        elif parallel == "sharded":
+            # Each child process reads its own byte range of the
+            # article file, so the parent is not a bottleneck for I/O and
+            # pickling article text.  Results come back one shard at
+            # a time, in no particular order.
+            #
+            # callback_function will get two arguments: article_title, article_text
+            global shard_keep_article_results
+            global shard_previous_results_file
+            shard_callback_function = callback_function
+            shard_keep_article_results = bool(results_file or previous_results_file or record_files)
+            index_has_revisions = has_revision_index(filename)
+            if shard_keep_article_results and not index_has_revisions:
+                # Without revision IDs and hashes, results can't be
+                # matched to a later run's articles
+                if (previous_results_file or results_file) and os.path.exists(get_index_filename(filename)):
+                    print(f"{get_index_filename(filename)} has no revision IDs (older format); "
+                          "regenerate it with xml_to_csv.py to reuse article results.  Checking all articles.",
+                          file=sys.stderr)
+                previous_results_file = None
+            shard_previous_results_file = check_previous_results_file(previous_results_file)
+            results_db = None
+            if results_file:
+                results_db = create_results_db(results_file)
+            for (tag, record_filename) in (record_files or {}).items():
+                record_output_files[tag] = open(record_filename, "w")
+
+            shard_ranges = get_shard_ranges(filename, CPU_COUNT * SHARDS_PER_CPU)
+            if not index_has_revisions:
+                shard_ranges = [(start_offset, end_offset, None) for (start_offset, end_offset, _) in shard_ranges]
+            shards = [(filename, start_offset, end_offset, which_articles, index_offset, prefilter_re)
+                      for (start_offset, end_offset, index_offset) in shard_ranges]
+            with multiprocessing.Pool(CPU_COUNT) as pool:
+                count = 0
+                for result_list in pool.imap_unordered(process_shard, shards):
+                    with profile_phase("results"):
+                        if shard_keep_article_results:
+                            for (article_title, revision_id, sha1, result, printed) in result_list:
+                                write_printed(printed)
+                                if result is not None:
+                                    process_result_callback(result)
+                        else:
+                            for result in result_list:
+                                process_result_callback(result)
+                    if results_db:
+                        with profile_phase("results_db"):
+                            save_article_results(results_db, result_list)
+                    count += 1
+                    print(f"Finished shard {count}/{len(shards)} - " + str(datetime.datetime.now().isoformat()),
+                          file=sys.stderr)
+                pool.close()
+                pool.join()
+            if results_db:
+                results_db.close()
+            for record_file in record_output_files.values():
+                record_file.close()
+            record_output_files.clear()
     else:
-        result = [callback_function(article_title, article_text)
+        result = [check_article(callback_function, article_title, article_text)
                   for (article_title, article_text)
                   in page_generator_fast(filename)]
-        process_result_callback(result)
+        with profile_phase("results"):
+            process_result_callback(result)
+    if PROFILE_FILE:
+        write_profile_summary(time.perf_counter() - start_time)
+
+
+# Writes what an article printed to stdout, except record lines go to
+# their files in record_output_files
+def write_printed(printed):
+    if not record_output_files:
+        sys.stdout.write(printed)
+        return
+    for line in io.StringIO(printed):
+        record_file = record_output_files.get(line.split("\t", 1)[0])
+        if record_file:
+            record_file.write(line)
+        else:
+            sys.stdout.write(line)
+
+
+def chunk_generator(articles, chunk_bytes):
+    chunk = []
+    chunk_size = 0
+    for (article_title, article_text) in articles:
+        chunk.append((article_title, article_text))
+        chunk_size += len(article_text)
+        if chunk_size >= chunk_bytes:
+            yield chunk
+            chunk = []
+            chunk_size = 0
+    if chunk:
+        yield chunk
+
+
+# For parallel=True, where callback_function gets one argument:
+# (article_title, article_text)
+def check_article_params(params):
+    count_profile_event("articles")
+    with profile_phase("check"):
+        return shard_callback_function(params)
+
+
+# For parallel=True and "incremental", where there's no end of a
+# shard or chunk to flush at: flush when each child process exits
+# (including when retired by maxtasksperchild).  The pool must be
+# closed and joined rather than terminated for this to run.
+def init_pool_child():
+    multiprocessing.util.Finalize(None, flush_child_data, exitpriority=10)
+
+
+def process_chunk(chunk):
+    results = [check_article(shard_callback_function, article_title, article_text)
+               for (article_title, article_text) in chunk]
+    flush_child_data()
+    return results
+
+
+def register_child_flush_function(flush_function):
+    child_flush_functions.append(flush_function)
+
+
+def flush_child_data():
+    for flush_function in child_flush_functions:
+        flush_function()
+
+
+def print_pool_status(count, in_flight_count):
+    parent = psutil.Process()
+    memory = parent.memory_info().rss
+    for child in parent.children():
+        try:
+            memory += child.memory_info().rss
+        except psutil.NoSuchProcess:
+            # Replaced due to maxtasksperchild
+            pass
+    memory_mb = memory // (1024 * 1024)
+    print(f"Submitted {count} tasks; {in_flight_count} in flight; {memory_mb} MB resident - "
+          + str(datetime.datetime.now().isoformat()),
+          file=sys.stderr)
 
 
 def parallel_error(error):
@@ -90,7 +511,10 @@ def parallel_error(error):
     raise Exception("ERROR IN CHILD PROCESS")
 
 
-def page_generator_fast(filename=DEFAULT_CSV_FILE, which_articles="ALL"):
+def page_generator_fast(filename=DEFAULT_ARTICLE_FILE, which_articles="ALL"):
+    if is_container_file(filename):
+        yield from page_generator_container(filename, 0, None, which_articles)
+        return
     count = 0
     # Using formfeed as line separator so article text can have newlines.
     with open(filename, "r", newline="\r") as article_csv_file:
@@ -120,3 +544,372 @@ def skip_article(article_title, which_articles):
     if article_title[0] == which_articles:
         return False
     return True
+
+
+def get_index_filename(filename):
+    # Written by xml_to_csv.py alongside the article file
+    return re.sub(r"\.csv$", "", filename) + ".idx"
+
+
+def is_container_file(filename):
+    return filename.endswith(CONTAINER_SUFFIX)
+
+
+# Returns a list of (start_offset, end_offset, index_offset) byte
+# ranges which together cover the whole file, each starting at the
+# beginning of an article record.  index_offset is where the index
+# entry for the first article in the shard is, or None if there is no
+# index file.
+def get_shard_ranges(filename, shard_count):
+    file_size = os.path.getsize(filename)
+    targets = [file_size * i // shard_count for i in range(1, shard_count)]
+    index_filename = get_index_filename(filename)
+    if os.path.exists(index_filename):
+        boundaries = [(0, 0)] + get_boundaries_from_index(index_filename, targets)
+    elif is_container_file(filename):
+        print(f"No index file {index_filename}; reading frame headers for shard boundaries", file=sys.stderr)
+        boundaries = [(offset, None) for offset in [0] + get_boundaries_from_frames(filename, targets)]
+    else:
+        print(f"No index file {index_filename}; scanning for shard boundaries", file=sys.stderr)
+        boundaries = [(offset, None) for offset in [0] + get_boundaries_from_scan(filename, targets)]
+    boundaries = sorted(set(b for b in boundaries if b[0] < file_size)) + [(file_size, None)]
+    return [(start_offset, end_offset, index_offset)
+            for ((start_offset, index_offset), (end_offset, _)) in zip(boundaries[:-1], boundaries[1:])]
+
+
+def get_boundaries_from_index(index_filename, targets):
+    # The index is in file order, so this only needs one pass.
+    boundaries = []
+    target_iter = iter(targets)
+    target = next(target_iter, None)
+    index_offset = 0
+    with open(index_filename, "rb") as index_file:
+        for line in index_file:
+            if target is None:
+                break
+            offset = int(line.split(b"\t")[1])
+            if offset >= target:
+                boundaries.append((offset, index_offset))
+                while target is not None and target <= offset:
+                    target = next(target_iter, None)
+            index_offset += len(line)
+    return boundaries
+
+
+def get_boundaries_from_scan(filename, targets):
+    # Without an index, start each shard just after the first record
+    # separator at or after the target offset.
+    boundaries = []
+    with open(filename, "rb") as article_csv_file:
+        for target in targets:
+            article_csv_file.seek(target)
+            while True:
+                block = article_csv_file.read(SHARD_READ_SIZE)
+                if not block:
+                    break
+                separator_index = block.find(b"\r")
+                if separator_index > -1:
+                    boundaries.append(article_csv_file.tell() - len(block) + separator_index + 1)
+                    break
+    return boundaries
+
+
+def get_boundaries_from_frames(filename, targets):
+    # Without an index, hop from frame header to frame header.
+    boundaries = []
+    target_iter = iter(targets)
+    target = next(target_iter, None)
+    offset = 0
+    with open(filename, "rb") as container_file:
+        while target is not None:
+            container_file.seek(offset)
+            frame_header = container_file.read(CONTAINER_FRAME_HEADER.size)
+            if len(frame_header) < CONTAINER_FRAME_HEADER.size:
+                break
+            if offset >= target:
+                boundaries.append(offset)
+                while target is not None and target <= offset:
+                    target = next(target_iter, None)
+            offset += CONTAINER_FRAME_HEADER.size + CONTAINER_FRAME_HEADER.unpack(frame_header)[0]
+    return boundaries
+
+
+def process_shard(shard):
+    (filename, start_offset, end_offset, which_articles, index_offset, prefilter_re) = shard
+    if is_container_file(filename):
+        articles = page_generator_container(filename, start_offset, end_offset, which_articles, prefilter_re)
+    else:
+        articles = page_generator_shard(filename, start_offset, end_offset, which_articles, prefilter_re)
+    if shard_keep_article_results:
+        index_entries = {}
+        if index_offset is not None:
+            index_entries = get_index_entries(get_index_filename(filename), index_offset, end_offset)
+        results = [get_article_result(article_title, article_text, *index_entries.get(article_title, (None, None)))
+                   for (article_title, article_text) in articles]
+    else:
+        results = [result
+                   for result
+                   in [check_article(shard_callback_function, article_title, article_text)
+                       for (article_title, article_text) in articles]
+                   if result is not None]
+    flush_child_data()
+    return results
+
+
+# Whether the index for filename exists and has the revision ID and
+# SHA-1 columns that get_index_entries() needs; older indexes only
+# have title, offset and length
+def has_revision_index(filename):
+    index_filename = get_index_filename(filename)
+    if not os.path.exists(index_filename):
+        return False
+    with open(index_filename, "rb") as index_file:
+        first_line = index_file.readline()
+    return first_line.count(b"\t") == 4
+
+
+# Returns {article_title: (revision_id, sha1)} for articles in the
+# index from index_offset up to (but not including) end_offset in the
+# article file
+def get_index_entries(index_filename, index_offset, end_offset):
+    index_entries = {}
+    with open(index_filename, "rb") as index_file:
+        index_file.seek(index_offset)
+        for line in index_file:
+            (article_title, offset, _length, revision_id, sha1) = line.decode("utf-8").rstrip("\n").split("\t")
+            if int(offset) >= end_offset:
+                break
+            index_entries[article_title] = (revision_id, sha1)
+    return index_entries
+
+
+def page_generator_shard(filename, start_offset, end_offset, which_articles="ALL", prefilter_re=None):
+    # Same output as page_generator_fast(), but only for articles
+    # which start between start_offset and end_offset.
+    with open(filename, "rb") as article_csv_file:
+        article_csv_file.seek(start_offset)
+        bytes_remaining = end_offset - start_offset
+        leftover = b""
+        while bytes_remaining > 0:
+            with profile_phase("read"):
+                block = article_csv_file.read(min(SHARD_READ_SIZE, bytes_remaining))
+            if not block:
+                break
+            bytes_remaining -= len(block)
+            records = (leftover + block).split(b"\r")
+            leftover = records.pop()
+            for record in records:
+                if prefilter_re and not prefilter_re.search(record, record.index(b"\t") + 1):
+                    continue
+                # page_generator_fast() leaves the separator on article_text
+                (article_title, article_text) = (record.decode("utf-8") + "\r").split("\t", 1)
+                if skip_article(article_title, which_articles):
+                    continue
+                yield (article_title, article_text)
+        if leftover and not (prefilter_re and not prefilter_re.search(leftover, leftover.index(b"\t") + 1)):
+            # Last record in the file might not have a separator
+            (article_title, article_text) = leftover.decode("utf-8").split("\t", 1)
+            if not skip_article(article_title, which_articles):
+                yield (article_title, article_text)
+
+
+def page_generator_container(filename, start_offset, end_offset, which_articles="ALL", prefilter_re=None):
+    # Same output as page_generator_fast() on the article CSV, for
+    # articles in frames which start between start_offset and
+    # end_offset (or the end of the file, if None).  Frames are
+    # decompressed straight out of the mapped file, and article text
+    # is only decoded if it gets past which_articles and prefilter_re.
+    decompressor = zstandard.ZstdDecompressor()
+    with open(filename, "rb") as container_file:
+        if os.fstat(container_file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(container_file.fileno(), 0, access=mmap.ACCESS_READ) as container:
+            if end_offset is None:
+                end_offset = len(container)
+            offset = start_offset
+            while offset < end_offset:
+                (frame_length,) = CONTAINER_FRAME_HEADER.unpack_from(container, offset)
+                offset += CONTAINER_FRAME_HEADER.size
+                with memoryview(container) as container_view, profile_phase("decompress"):
+                    frame = decompressor.decompress(container_view[offset:offset + frame_length])
+                offset += frame_length
+
+                frame_view = memoryview(frame)
+                record_offset = 0
+                while record_offset < len(frame):
+                    (title_length, text_length) = CONTAINER_RECORD_HEADER.unpack_from(frame, record_offset)
+                    record_offset += CONTAINER_RECORD_HEADER.size
+                    article_title = str(frame_view[record_offset:record_offset + title_length], "utf-8")
+                    record_offset += title_length
+                    text_view = frame_view[record_offset:record_offset + text_length]
+                    record_offset += text_length
+                    if skip_article(article_title, which_articles):
+                        continue
+                    if prefilter_re and not prefilter_re.search(text_view):
+                        continue
+                    # page_generator_fast() leaves the separator on article_text
+                    yield (article_title, str(text_view, "utf-8") + "\r")
+
+
+# -- Single-pass scans running several registered checks --
+
+# article_callback gets two arguments: article_title, article_text
+# and runs in child processes.  result_callback gets whatever
+# article_callback returned and runs in the parent (like
+# process_result_callback).  dump_callback runs in the parent once all
+# articles have been read.
+def register_check(check_name, article_callback, result_callback=print_result, dump_callback=None):
+    registered_checks[check_name] = (article_callback, result_callback, dump_callback)
+
+
+def run_registered_checks(article_title, article_text):
+    # Anything a check prints is captured and returned, so the parent
+    # can write it to that check's own output file.
+    wikitext_util.derived_text_cache = {}
+    check_results = []
+    for (check_name, (article_callback, result_callback, dump_callback)) in registered_checks.items():
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            result = article_callback(article_title, article_text)
+        if result is not None or printed.tell():
+            check_results.append((check_name, result, printed.getvalue()))
+    wikitext_util.derived_text_cache = None
+    return check_results
+
+
+def process_check_results(check_results):
+    for (check_name, result, printed) in check_results:
+        output_file = check_output_files[check_name]
+        output_file.write(printed)
+        with contextlib.redirect_stdout(output_file):
+            registered_checks[check_name][1](result)
+
+
+# output_filenames maps check names to the file that gets what that
+# check would have printed to stdout if run by itself.
+def scan_registered_checks(output_filenames, filename=DEFAULT_ARTICLE_FILE, which_articles="ALL"):
+    unknown_checks = set(output_filenames) - set(registered_checks)
+    if unknown_checks:
+        raise Exception(f"Checks not registered: {', '.join(sorted(unknown_checks))}")
+
+    # Importing some reports registers others they depend on
+    for check_name in list(registered_checks):
+        if check_name not in output_filenames:
+            del registered_checks[check_name]
+
+    for (check_name, output_filename) in output_filenames.items():
+        check_output_files[check_name] = open(output_filename, "w")
+
+    read_en_article_text(run_registered_checks,
+                         filename=filename,
+                         parallel="sharded",
+                         process_result_callback=process_check_results,
+                         which_articles=which_articles)
+
+    for (check_name, (article_callback, result_callback, dump_callback)) in registered_checks.items():
+        if dump_callback:
+            print(f"Dumping results for {check_name} - " + str(datetime.datetime.now().isoformat()), file=sys.stderr)
+            with contextlib.redirect_stdout(check_output_files[check_name]):
+                dump_callback()
+        check_output_files[check_name].close()
+
+
+# -- Reuse of per-article results from a previous run --
+
+# Note that checks which depend on data downloaded with each dump
+# (like the spell check dictionary) will repeat old answers for
+# unchanged articles, so a full run is still needed now and then.
+
+def get_code_version():
+    # Any change to moss code invalidates results from previous runs
+    code_hash = hashlib.sha1()
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    for code_filename in sorted(os.listdir(code_dir)):
+        if code_filename.endswith(".py"):
+            with open(os.path.join(code_dir, code_filename), "rb") as code_file:
+                code_hash.update(code_file.read())
+    return code_hash.hexdigest()
+
+
+# For reports run from run_moss.sh; returns filename in the run
+# directory named by MOSS_PREVIOUS_RUN, if set and the file exists
+def get_previous_run_file(filename):
+    previous_run = os.environ.get("MOSS_PREVIOUS_RUN")
+    if not previous_run:
+        return None
+    previous_run_file = os.path.join(previous_run, filename)
+    if not os.path.exists(previous_run_file):
+        return None
+    return previous_run_file
+
+
+# For reports run from run_moss.sh; returns results_file if article
+# results should be saved for a later run to reuse (MOSS_SAVE_RESULTS
+# is set, or this run reuses MOSS_PREVIOUS_RUN's), otherwise None, since
+# saving them means capturing and storing what every article printed
+def get_results_file(results_file):
+    if os.environ.get("MOSS_SAVE_RESULTS") or os.environ.get("MOSS_PREVIOUS_RUN"):
+        return results_file
+    return None
+
+
+def get_previous_results_file(results_file):
+    previous_results_file = get_previous_run_file(results_file)
+    if os.environ.get("MOSS_PREVIOUS_RUN") and not previous_results_file:
+        print(f"No previous {results_file} in {os.environ['MOSS_PREVIOUS_RUN']}; checking all articles", file=sys.stderr)
+    return previous_results_file
+
+
+def check_previous_results_file(previous_results_file):
+    if not previous_results_file:
+        return None
+    with contextlib.closing(sqlite3.connect(f"file:{previous_results_file}?mode=ro", uri=True)) as db:
+        row = db.execute("SELECT version FROM results_version").fetchone()
+    if not row or row[0] != get_code_version():
+        print(f"Code has changed since {previous_results_file} was made; checking all articles", file=sys.stderr)
+        return None
+    print(f"Reusing results from {previous_results_file} for unchanged articles", file=sys.stderr)
+    return previous_results_file
+
+
+def create_results_db(results_file):
+    if os.path.exists(results_file):
+        os.remove(results_file)
+    db = sqlite3.connect(results_file)
+    db.execute("PRAGMA synchronous=OFF")
+    db.execute("CREATE TABLE article_results ("
+               " title TEXT NOT NULL PRIMARY KEY,"
+               " revision_id TEXT,"
+               " sha1 TEXT,"
+               " result BLOB,"
+               " printed TEXT NOT NULL) WITHOUT ROWID")
+    db.execute("CREATE TABLE results_version (version TEXT NOT NULL)")
+    db.execute("INSERT INTO results_version (version) VALUES (?)", (get_code_version(),))
+    db.commit()
+    return db
+
+
+def save_article_results(results_db, result_list):
+    with results_db:
+        results_db.executemany("INSERT OR REPLACE INTO article_results (title, revision_id, sha1, result, printed) VALUES (?, ?, ?, ?, ?)",
+                               [(article_title, revision_id, sha1, pickle.dumps(result), printed)
+                                for (article_title, revision_id, sha1, result, printed) in result_list])
+
+
+def get_article_result(article_title, article_text, revision_id, sha1):
+    global previous_results_db
+
+    # Runs in child processes
+    if sha1 and shard_previous_results_file:
+        if previous_results_db is None:
+            previous_results_db = sqlite3.connect(f"file:{shard_previous_results_file}?mode=ro", uri=True)
+        row = previous_results_db.execute("SELECT sha1, result, printed FROM article_results WHERE title = ?",
+                                          (article_title,)).fetchone()
+        if row and row[0] == sha1:
+            count_profile_event("reused_articles")
+            return (article_title, revision_id, sha1, pickle.loads(row[1]), row[2])
+
+    printed = io.StringIO()
+    with contextlib.redirect_stdout(printed):
+        result = check_article(shard_callback_function, article_title, article_text)
+    return (article_title, revision_id, sha1, result, printed.getvalue())
@@ -1,4 +1,5 @@
-from moss_dump_analyzer import read_en_article_text
+from collections import Counter
+from moss_dump_analyzer import read_en_article_text, register_check, get_previous_results_file, get_results_file
 import re
 import sys
 from unencode_entities import (
@@ -46,6 +47,60 @@ non_entity_transform = [string for string
 # In code:
 # for (_end_index, instance) in alert_automaton.iter(article_text):
 
+# Faster than string.count() for each check string: count the
+# article's non-ASCII characters in one pass (most articles have few
+# or none), then only count check strings containing a character that
+# occurs.  ASCII-only check strings (a couple dozen) are still counted
+# directly.
+
+non_ascii_re = re.compile(r"[^\x00-\x7f]")
+
+
+# Returns (ASCII-only check strings, other check strings by their first
+# non-ASCII character, position of each check string) for
+# count_check_strings()
+def make_census_plan(check_strings):
+    ascii_strings = []
+    strings_by_character = {}
+    for check_string in check_strings:
+        non_ascii_characters = non_ascii_re.findall(check_string)
+        if non_ascii_characters:
+            strings_by_character.setdefault(non_ascii_characters[0], []).append(check_string)
+        else:
+            ascii_strings.append(check_string)
+    positions = {check_string: position for (position, check_string) in enumerate(check_strings)}
+    return (ascii_strings, strings_by_character, positions)
+
+
+# Returns [(check string, number of times it occurs)] for the check
+# strings in article_text, in the order they were given to
+# make_census_plan()
+def count_check_strings(article_text, census_plan):
+    (ascii_strings, strings_by_character, positions) = census_plan
+    found = []
+    for check_string in ascii_strings:
+        found_count = article_text.count(check_string)
+        if found_count:
+            found.append((check_string, found_count))
+
+    if not article_text.isascii():
+        character_counts = Counter(non_ascii_re.findall(article_text))
+        for character in character_counts.keys() & strings_by_character.keys():
+            for check_string in strings_by_character[character]:
+                if check_string == character:
+                    found_count = character_counts[character]
+                else:
+                    found_count = article_text.count(check_string)
+                if found_count:
+                    found.append((check_string, found_count))
+
+    found.sort(key=lambda pair: positions[pair[0]])
+    return found
+
+
+non_entity_census_plan = make_census_plan(non_entity_transform)
+alert_census_plan = make_census_plan(alert)
+
 # --
 
 article_blocklist = [
@@ -273,14 +328,18 @@ def entity_check(article_title, article_text):
 def subcheck_alert(article_text, article_title, hint=None):
     result_tuples = []
 
-    # Weirdly, this is a lot faster than a pre-compiled regular
-    # expression or Aho-Corasick automaton.
+    # Weirdly, string.count() is a lot faster than a pre-compiled
+    # regular expression or Aho-Corasick automaton.
     # if not any(alert_word in article_text for alert_word in alert):
     #     return
     # for instance in alert_re.findall(article_text):
 
-    for check_string in hint or alert:
-        found_count = article_text.count(check_string)
+    if hint:
+        found_strings = [(check_string, article_text.count(check_string)) for check_string in hint]
+    else:
+        found_strings = count_check_strings(article_text, alert_census_plan)
+
+    for (check_string, found_count) in found_strings:
         if not found_count:
             continue
 
@@ -297,8 +356,12 @@ def subcheck_non_entity(article_text, article_title, hint=None):
     # Not constructing here because it's rarely needed and uses a lot
     # of CPU (.5 sec per 10,000 articles)
 
-    for check_string in hint or non_entity_transform:
-        found_count = article_text.count(check_string)
+    if hint:
+        found_strings = [(check_string, article_text.count(check_string)) for check_string in hint]
+    else:
+        found_strings = count_check_strings(article_text, non_entity_census_plan)
+
+    for (check_string, found_count) in found_strings:
         if not found_count:
             continue
 
@@ -678,6 +741,11 @@ def dump_results():
         dump_for_jwb("combo", bad_entities, file=combof, articles=articles)
 
 
+register_check("entities", entity_check, add_tuples_to_results, dump_results)
+
+
 if __name__ == '__main__':
-    read_en_article_text(entity_check, process_result_callback=add_tuples_to_results, parallel="incremental")
+    read_en_article_text(entity_check, process_result_callback=add_tuples_to_results, parallel="sharded",
+                         results_file=get_results_file("article-results-entities.sqlite"),
+                         previous_results_file=get_previous_results_file("article-results-entities.sqlite"))
     dump_results()
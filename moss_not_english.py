@@ -7,7 +7,9 @@ from collections import defaultdict
 import gcld3
 import re
 import sys
-from moss_dump_analyzer import read_en_article_text
+from lexicon_file import word_set_contains
+from lexicons import get_lexicon, get_requested_species_titles
+from moss_dump_analyzer import read_en_article_text, register_check
 from moss_entity_check import suppression_patterns
 from wikitext_util import wikitext_to_plaintext, get_main_body_wikitext, ignore_tags_re
 
@@ -25,40 +27,18 @@ GOOGLE_LANG_DETECTOR = gcld3.NNetLanguageIdentifier(min_num_bytes=0,
 
 print("Loading dictionaries...", file=sys.stderr)
 
-with open("/var/local/moss/bulk-wikipedia/titles_all_wiktionaries_uniq.txt", "r") as title_list:
-    ALL_WORDS = set(word.strip() for word in title_list)
-with open("/var/local/moss/bulk-wikipedia/english_words_only.txt", "r") as title_list:
-    ENGLISH_WORDS = set(word.strip() for word in title_list)
-
-SPECIES_WORDS = list()
-for filename in [
-        "/var/local/moss/bulk-wikipedia/specieswiki-latest-all-titles-in-ns0",
-        "/var/local/moss/bulk-wikipedia/Wikispecies:Requested_articles",
-        "/var/local/moss/bulk-wikipedia/Before_2019",
-        "/var/local/moss/bulk-wikipedia/2020",
-        "/var/local/moss/bulk-wikipedia/2021",
-]:
-    with open(filename, "r") as title_list:
-        for line in title_list:
-            line = line.replace("_", " ").strip()
-            SPECIES_WORDS.extend(list(WORD_RE.findall(line)))
-SPECIES_WORDS = set(SPECIES_WORDS)
-
-REQUESTED_SPECIES_HTML = ""
-for filename in [
-        "/var/local/moss/bulk-wikipedia/Wikispecies:Requested_articles",
-        "/var/local/moss/bulk-wikipedia/Before_2019",
-        "/var/local/moss/bulk-wikipedia/2020",
-        "/var/local/moss/bulk-wikipedia/2021",
-]:
-    with open(filename, 'r') as requested_species_file:
-        REQUESTED_SPECIES_HTML += requested_species_file.read()
+# See lexicons.py
+ALL_WORDS = get_lexicon("all_wiktionaries")
+ENGLISH_WORDS = get_lexicon("english_words")
+SPECIES_WORDS = get_lexicon("species_words")
+
+REQUESTED_SPECIES_TITLES = get_requested_species_titles()
 
 print("Done loading.", file=sys.stderr)
 
 
 def is_correct_word(word):
-    if word in ALL_WORDS:
+    if word_set_contains(ALL_WORDS, word):
         return True
     # if word.lower() in ALL_WORDS:
     #     return True
@@ -66,15 +46,15 @@ def is_correct_word(word):
 
 
 def is_english_word(word):
-    if word in ENGLISH_WORDS:
+    if word_set_contains(ENGLISH_WORDS, word):
         return True
     word_lower = word.lower()
-    if word_lower in ENGLISH_WORDS:
+    if word_set_contains(ENGLISH_WORDS, word_lower):
         return True
     if word.endswith("'s"):
-        if word[0:-2] in ENGLISH_WORDS:
+        if word_set_contains(ENGLISH_WORDS, word[0:-2]):
             return True
-        if word_lower[0:-2] in ENGLISH_WORDS:
+        if word_set_contains(ENGLISH_WORDS, word_lower[0:-2]):
             return True
     return False
 
@@ -86,9 +66,7 @@ def find_non_english(params):
     if ignore_tags_re.search(article_text):
         return
 
-    request_search_string_en = 'title="en:%s"' % article_title
-    request_search_string_w = 'title="w:%s"' % article_title
-    if request_search_string_en in REQUESTED_SPECIES_HTML or request_search_string_w in REQUESTED_SPECIES_HTML:
+    if "en:" + article_title in REQUESTED_SPECIES_TITLES or "w:" + article_title in REQUESTED_SPECIES_TITLES:
         return
 
     article_text = wikitext_to_plaintext(article_text)
@@ -116,7 +94,7 @@ def find_non_english(params):
                 # of Greek variables in STEM articles.
                 continue
 
-            if is_english_word(word_mixedcase) or word_mixedcase in SPECIES_WORDS:
+            if is_english_word(word_mixedcase) or word_set_contains(SPECIES_WORDS, word_mixedcase):
                 paragraph_words_by_lang["en"].append(word_mixedcase)
                 continue
 
@@ -174,6 +152,14 @@ def find_non_english(params):
     print(output_line, flush=True)
 
 
+# For moss_single_pass.py, which passes title and text separately
+def find_non_english_by_article(article_title, article_text):
+    return find_non_english((article_title, article_text))
+
+
+register_check("not_english", find_non_english_by_article)
+
+
 if __name__ == '__main__':
     print("Starting search...", file=sys.stderr)
     read_en_article_text(find_non_english, parallel=True)
@@ -4,8 +4,8 @@ import datetime
 import re
 import textstat
 import sys
-from moss_dump_analyzer import read_en_article_text
-from wikitext_util import wikitext_to_plaintext, get_main_body_wikitext, ignore_tags_re
+from moss_dump_analyzer import read_en_article_text, register_check
+from wikitext_util import wikitext_to_plaintext, get_main_body_view_paragraphs, ignore_tags_re
 
 
 list_cleanup_re = re.compile(r"(^|\n)[ :#\*].*")
@@ -61,11 +61,9 @@ def check_reading_level(article_title, article_text):
         return
 
     article_text = wikitext_to_plaintext(article_text)
-    article_text = get_main_body_wikitext(article_text, ignore_nonprose=True)
-    article_text = article_text.replace("✂", "")
 
     # Non-prose is out of scope for readability metrics
-    paragraphs = article_text.split("\n")
+    paragraphs = [para.replace("✂", "") for para in get_main_body_view_paragraphs(article_text, "prose")]
     paragraphs = [para for para in paragraphs if is_prose_paragraph(para)]
     article_text = "\n".join(paragraphs)
 
@@ -107,7 +105,10 @@ def check_reading_level(article_title, article_text):
     return f"* {article_difficulty_level} - [[{article_title}]]"
 
 
+register_check("readability", check_reading_level)
+
+
 if __name__ == '__main__':
     print(f"Started at {datetime.datetime.now().isoformat()}", file=sys.stderr)
-    read_en_article_text(check_reading_level, parallel="incremental")
+    read_en_article_text(check_reading_level, parallel="chunked")
     print(f"Finished at {datetime.datetime.now().isoformat()}", file=sys.stderr)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+# Runs several dump checks with a single read of the article CSV,
+# instead of each check re-reading and re-parsing all the articles.
+# Plaintext conversion and main-body extraction are shared between
+# checks looking at the same article.
+#
+# Usage:
+#  venv/bin/python3 moss_single_pass.py CHECK=OUTPUT_FILE [CHECK=OUTPUT_FILE ...]
+#
+# For example, from a run directory:
+#  ../venv/bin/python3 ../moss_single_pass.py entities=tmp-entities readability=tmp-readability.txt
+#
+# Each output file gets what that check's own script would have
+# printed to stdout, so the usual post-processing can be run on it.
+
+import importlib
+import sys
+from moss_dump_analyzer import scan_registered_checks
+
+# Importing each of these modules registers the check with
+# moss_dump_analyzer.register_check()
+CHECK_MODULES = {
+    "chemical_formulas": "chemical_formula_report",
+    "entities": "moss_entity_check",
+    "not_english": "moss_not_english",
+    "readability": "moss_readability_check",
+    "retf": "retf_offline_scan",
+    "spell": "moss_spell_check",
+    "style_by_line": "moss_check_style_by_line",
+}
+
+
+if __name__ == '__main__':
+    output_filenames = {}
+    for arg in sys.argv[1:]:
+        if "=" not in arg:
+            print(f"Expected CHECK=OUTPUT_FILE but got '{arg}'", file=sys.stderr)
+            exit(1)
+        (check_name, output_filename) = arg.split("=", 1)
+        if check_name not in CHECK_MODULES:
+            print(f"Unknown check '{check_name}'; choose from: {', '.join(CHECK_MODULES)}", file=sys.stderr)
+            exit(1)
+        output_filenames[check_name] = output_filename
+    if not output_filenames:
+        print("Please specify at least one CHECK=OUTPUT_FILE", file=sys.stderr)
+        exit(1)
+
+    for check_name in output_filenames:
+        importlib.import_module(CHECK_MODULES[check_name])
+
+    scan_registered_checks(output_filenames)
+    print("Done", file=sys.stderr)
@@ -1,13 +1,18 @@
 # -*- coding: utf-8 -*-
 
 from collections import defaultdict
-import nltk
 import re
 import sys
-from moss_dump_analyzer import read_en_article_text
-from wikitext_util import wikitext_to_plaintext, get_main_body_wikitext, ignore_tags_re
-from spell import is_word_spelled_correctly, bad_words
+from lexicons import REQUESTED_SPECIES_FILES, get_requested_species_titles
+from moss_dump_analyzer import (read_en_article_text, register_check, register_child_flush_function,
+                                get_previous_results_file, get_previous_run_file, get_results_file, count_profile_event, profile_phase)
+from wikitext_util import (wikitext_to_plaintext, wikitext_to_plaintext_with_offsets, get_main_body_wikitext,
+                           get_main_body_wikitext_with_offsets, ignore_tags_re, count_markup, get_markup_excerpts)
+from spell import (is_word_spelled_correctly, is_known_word, bad_words, flush_word_counts, load_verdict_table,
+                   print_verdict_cache_stats, record_word_counts)
+from title_index import add_to_title_index, close_title_index, open_title_index, title_index_items
 from word_categorizer import is_chemical_name, is_chemical_formula, is_chess_notation
+from word_tokenizer import tokenize, tokenize_with_offsets
 
 # TODO:
 # * Flag articles for topic (e.g. species, genus) and language hints
@@ -48,27 +53,37 @@ from word_categorizer import is_chemical_name, is_chemical_formula, is_chess_not
 #   be pretty solid.
 
 
-misspelled_words = {}
-# Indexes articles by typo.  For example:
-# {'misspellling': (2, ['article1', 'article2'])}
+misspelled_words = None
+# Indexes articles by typo (see title_index.py); opened on first use.
+# For example, reading it back gives:
+# ('misspellling', 2, ['article1', 'article2'])
 
 
 def dump_results():
     global misspelled_words
-    misspelled_by_freq = [(value[0], key, value[1]) for (key, value) in misspelled_words.items()]
-    misspelled_by_freq = sorted(misspelled_by_freq)
-    for (freq, word, article_list) in misspelled_by_freq:
-        uniq_list = list(set(article_list))
-        uniq_list.sort()
+    if misspelled_words is None:
+        return
+
+    # The index comes back in order of word, but output is sorted by
+    # frequency, so the output lines go through another index keyed
+    # by zero-padded frequency and word.
+    output_lines = open_title_index()
+    for (word, freq, article_list) in title_index_items(misspelled_words):
         uniq_string = ""
-        if uniq_list:
-            uniq_string = u"[[" + u"]], [[".join(uniq_list) + u"]]"
+        if article_list:
+            uniq_string = u"[[" + u"]], [[".join(article_list) + u"]]"
         output_string = u"* %s - [[wikt:%s]] - %s" % (freq, word, uniq_string)
-        print(output_string)
+        add_to_title_index(output_lines, "%012d %s" % (freq, word), output_string)
+    close_title_index(misspelled_words)
+    misspelled_words = None
+
+    for (key, count, output_strings) in title_index_items(output_lines):
+        print(output_strings[0])
+    close_title_index(output_lines)
 
 
-start_template_re = re.compile(r"{{")
-end_template_re = re.compile(r"}}")
+# Checked in this order; each blocks spell-checking the article
+unmatched_markup = ["<ref", "</ref>", "<blockquote", "</blockquote>", "}}", "{{", '"', "colspan", "rowspan", "cellspacing"]
 unicode_letters_plus_dashes_re = re.compile(r"^([^\W\d_]|-)+$")
 spaced_emdash_re = re.compile(r".{0,10}—\s.{0,10}|.{0,10}\s—.{0,10}")
 newline_re = re.compile(r"\n")
@@ -85,9 +100,7 @@ bracket_missing_whitespace_re = re.compile(r"([a-zA-Z]+\([a-zA-Z]+\)?"
 
 punct_extra_whitespace_re = re.compile(r"\w+ ,\w+|\w+ \.\w+|\w+ \)|\( \w+|\[ \w+|\w+ ]")
 
-requested_species_html = ""
-with open('/var/local/moss/bulk-wikipedia/Wikispecies:Requested_articles', 'r') as requested_species_file:
-    requested_species_html = requested_species_file.read()
+requested_species_titles = get_requested_species_titles(REQUESTED_SPECIES_FILES[:1])
 
 article_skip_list = [
     "Unicode subscripts and superscripts",  # Really only need to suppress BC for this article
@@ -102,57 +115,73 @@ wikt_trans_re = re.compile(r"\{\{trans-see *\|(.*?)\}\}")
 gaol_fever_re = re.compile(r"gaol fever")
 
 
-# Returning True means "yes, ignore"
-def ignore_typo_in_context(word_mixedcase, article_text_orig):
+# Features of the whole article that ignore_typo_in_context() looks
+# for, found once per article instead of once per flagged word
+def get_context_flags(article_text_orig):
+    context_flags = set()
 
     # Hack to avoid having to do even more complicated token
     # re-assembly, though this may cause some unnecessary HTML
     # markup on the same page to be ignored.
-    if word_mixedcase == "<li>":
-        if "<li value=" in article_text_orig:
-            return True
-        if "<li value =" in article_text_orig:
-            return True
-        if "<ol start=" in article_text_orig:
-            return True
-        if "<ol start =" in article_text_orig:
-            return True
-    if word_mixedcase == "<ol>":
-        if "<ol start=" in article_text_orig:
-            return True
-        if "<ol start =" in article_text_orig:
-            return True
-
-    # TODO: In some situations this might actually be replaced
-    # with a streamlined wiki-style list, or footnote syntax.
-    if word_mixedcase == "<ol>" and "<ol type=" in article_text_orig:
-        return True
-    if word_mixedcase == "<li>" and "<ol type=" in article_text_orig:
-        return True
+    if "<li value=" in article_text_orig or "<li value =" in article_text_orig:
+        context_flags.add("li_value")
+    if "<ol start=" in article_text_orig or "<ol start =" in article_text_orig:
+        context_flags.add("ol_start")
+    if "<ol type=" in article_text_orig:
+        context_flags.add("ol_type")
 
     # Keep "gaol fever" as long as "jail fever" is glossed; per Google
     # Ngrams, "gaol fever" is still more common than "jail fever", but
     # "gaol" is not more common than "jail fever".
-    if word_mixedcase == "gaol":
-        if "jail fever" in article_text_orig:
-            article_text_copy = gaol_fever_re.sub("", article_text_orig)
-            if "gaol" not in article_text_copy:
-                return True
+    if "jail fever" in article_text_orig:
+        article_text_copy = gaol_fever_re.sub("", article_text_orig)
+        if "gaol" not in article_text_copy:
+            context_flags.add("gaol_fever_glossed")
 
     # Exceptions made by
     # https://en.wikipedia.org/wiki/Wikipedia:Manual_of_Style/Dates_and_numbers#Decimals
-    if caliber_re.search(word_mixedcase) and ("caliber" in article_text_orig or "calibre" in article_text_orig):
+    if "caliber" in article_text_orig or "calibre" in article_text_orig:
+        context_flags.add("caliber")
+    # Otherwise many readers will not know what e.g. "batting .123"
+    # means
+    if ("batting average" in article_text_orig
+            or "fielding percentage" in article_text_orig
+            or "slugging percentage" in article_text_orig):
+        context_flags.add("batting_average")
+
+    return context_flags
+
+
+# Returns an offset map from article text as prepared for spell
+# checking back to article_text_orig (see wikitext_util.py)
+def get_source_offsets(article_text_orig, include_quotations):
+    (article_text, offsets) = wikitext_to_plaintext_with_offsets(article_text_orig)
+    (article_text, offsets) = get_main_body_wikitext_with_offsets(article_text, offsets, include_quotations=include_quotations)
+    return offsets
+
+
+# Returning True means "yes, ignore"
+def ignore_typo_in_context(word_mixedcase, article_text_orig, context_flags):
+
+    if word_mixedcase == "<li>" and context_flags & {"li_value", "ol_start"}:
+        return True
+    if word_mixedcase == "<ol>" and "ol_start" in context_flags:
+        return True
+
+    # TODO: In some situations this might actually be replaced
+    # with a streamlined wiki-style list, or footnote syntax.
+    if word_mixedcase in ("<ol>", "<li>") and "ol_type" in context_flags:
+        return True
+
+    if word_mixedcase == "gaol" and "gaol_fever_glossed" in context_flags:
+        return True
+
+    if "caliber" in context_flags and caliber_re.search(word_mixedcase):
+        return True
+    if "batting_average" in context_flags and batting_average_re.search(word_mixedcase):
+        # Report as a Z error unless one of the articles on these
+        # statistics is linked in the text
         return True
-    if batting_average_re.search(word_mixedcase):
-        # Report as a Z error unless one of these articles is linked
-        # in the text (otherwise many readers will not know what
-        # e.g. "batting .123" means).
-        if "batting average" in article_text_orig:
-            return True
-        if "fielding percentage" in article_text_orig:
-            return True
-        if "slugging percentage" in article_text_orig:
-            return True
 
     # e.g. "Microsoft .NET"
     if " " in word_mixedcase:
@@ -238,23 +267,21 @@ def spellcheck_all_langs(article_title, article_text, wiktionary=False, include_
         print("S\tSKIPPING due to known cleanup tag\t%s" % article_title, flush=True)
         return
 
-    request_search_string_en = 'title="en:%s"' % article_title
-    request_search_string_w = 'title="w:%s"' % article_title
-    if request_search_string_en in requested_species_html or request_search_string_w in requested_species_html:
+    if "en:" + article_title in requested_species_titles or "w:" + article_title in requested_species_titles:
         print("S\tSKIPPING - list with requested species\t%s" % article_title, flush=True)
         return
 
     # -- Fatal problems --
 
     article_text_orig = article_text
-    article_text = wikitext_to_plaintext(article_text)
-    article_text = get_main_body_wikitext(article_text, include_quotations=include_quotations)
+    with profile_phase("plaintext"):
+        article_text = wikitext_to_plaintext(article_text)
+        article_text = get_main_body_wikitext(article_text, include_quotations=include_quotations)
 
     # This can break wikitext_to_plaintext() in ways that cause wiki
     # syntax to be mistaken for prose.
-    starters = start_template_re.findall(article_text)
-    enders = end_template_re.findall(article_text)
-    if len(starters) != len(enders):
+    markup_counts = count_markup(article_text, unmatched_markup)
+    if markup_counts["{{"] != markup_counts["}}"]:
         print("!\t* [[%s]] - Mismatched {{ }}" % article_title, flush=True)
         return
 
@@ -273,10 +300,9 @@ def spellcheck_all_langs(article_title, article_text, wiktionary=False, include_
 
     # -- More fatal problems --
 
-    for unmatched_item in ["<ref", "</ref>", "<blockquote", "</blockquote>", "}}", "{{", '"', "colspan", "rowspan", "cellspacing"]:
-        if unmatched_item in article_text:
-            matches = re.findall(r".{0,20}%s.{0,20}" % unmatched_item, article_text)
-            excerpt = " ... ".join(matches)
+    for unmatched_item in unmatched_markup:
+        if markup_counts[unmatched_item]:
+            excerpt = " ... ".join(get_markup_excerpts(article_text, unmatched_item))
             if unmatched_item == '"' and ("“" in article_text or "”" in article_text):
                 print("!Q\t* [[%s]] - Unmatched %s probably due to violation of [[MOS:STRAIGHT]] near: %s" % (article_title, unmatched_item, excerpt), flush=True)
             else:
@@ -291,11 +317,16 @@ def spellcheck_all_langs(article_title, article_text, wiktionary=False, include_
 
     article_oops_list = []
     article_text = article_text.replace("✂", " ")
+    context_flags = get_context_flags(article_text_orig)
+
+    # Maps offsets in article_text back to article_text_orig; only
+    # made when needed, since it's slower to make and isn't cached
+    source_offsets = None
 
     # -- Punctuation and whitespace errors not using word_list --
 
-    # NLTK tokenizer usually turns e.g. words with comma missing
-    # following whitespace into three tokens, e.g.
+    # The tokenizer (see word_tokenizer.py) turns e.g. words with
+    # comma missing following whitespace into three tokens, e.g.
     # "xxx,yyy" -> ['xxx', ',', 'yyy']
     missing_comma_typos = comma_missing_whitespace_re.findall(article_text)
     for typo in missing_comma_typos:
@@ -324,15 +355,19 @@ def spellcheck_all_langs(article_title, article_text, wiktionary=False, include_
         if is_word_spelled_correctly(typo) in [False, "uncertain"]:
             article_oops_list.append(typo)
 
-    # The NLTK tokenizer splits contractions in two
+    # The tokenizer splits contractions in two
     found_bad_words = bad_words_apos_re.findall(article_text)
     for bad_word in found_bad_words:
         article_oops_list.append(bad_word)
 
-    # -- Generate and fix tokenization of word_list --
+    # -- Generate word_list --
 
-    word_list = nltk.word_tokenize(article_text.replace("—", " - "))
-    # NLTK tokenizer sometimes doesn't split on emdash
+    # Tokens are (word, offset in article_text)
+    with profile_phase("tokenize"):
+        # Keep the period on words like "approx." that are spelled
+        # with one, so they get the same verdicts as before
+        word_list = tokenize_with_offsets(article_text, keep_period=lambda token: is_known_word(token.lower()))
+    count_profile_event("words", len(word_list))
 
     # Requested by User:Hftf
     if wiktionary:
@@ -340,120 +375,27 @@ def spellcheck_all_langs(article_title, article_text, wiktionary=False, include_
         for trans_xref in trans_xrefs:
             more_words_tmp = [param.strip() for param in str(trans_xref).split("|")]
             for param in more_words_tmp:
-                word_list.extend(nltk.word_tokenize(param))
-
-    # Old-fashioned loop to allow lookahead and cope with the fact
-    # that the length of word_list may change as it is edited in
-    # place.
-    i = 0
-    while i < len(word_list):
-        # TODO: Make test cases, especially for beginning and
-        # end-of-document HTML entities.
-
-        # Reassemble HTML markup the tokenizer has split into multiple
-        # words.  Must double-check because the tokenizer ignores
-        # whitespace, and we don't want to accidentally match
-        # e.g. where an ampersand in prose is followed shortly by a
-        # semicolon.
-
-        # TODO: Parameterize to avoid code duplication
-
-        # Two-token sequences
-        if i < len(word_list) - 1:
-            # Sometimes tokenization separates final period from the
-            # rest of the acronym.
-            if "." in word_list[i] and word_list[i + 1] == ".":
-                word_list[i] += "."
-                del word_list[i + 1]
-
-        # Three-token sequences
-        if i < len(word_list) - 2:
-            if word_list[i] == "&" and word_list[i + 2] == ";":
-
-                # Protect against & in acronyms, common for railroads
-                # and companies like AT&T, PG&E.
-                if i == 0 or not (re.match("^[A-Z]+s?$", word_list[i + 1])
-                                  and re.match("^[A-Z]+$", word_list[i - 1])):
-                    consolidated = "&%s;" % word_list[i + 1]
-                    if consolidated in article_text:
-                        word_list[i] = consolidated
-                        del word_list[i + 2]
-                        del word_list[i + 1]
-
-            elif word_list[i] == "<" and word_list[i + 2] == ">":
-                consolidated = "<%s>" % word_list[i + 1]
-                if consolidated in article_text:
-                    word_list[i] = consolidated
-                    del word_list[i + 2]
-                    del word_list[i + 1]
-
-            # In transliterations from Arabic script (which includes
-            # Persian), NLTK correctly parses U+0027 (apostrophe) and
-            # U+02BE/U+02BF (preferred by the Unicode Consortium and
-            # United Nations).
-            # https://en.wikipedia.org/wiki/Romanization_of_Persian
-            # https://en.wikipedia.org/wiki/Romanization_of_Arabic
-            #
-            # However, Wikipedia allows the use of U+2019 (right
-            # single quote mark) which NLTK will (arguably
-            # justifiably) misparse if used as something other than a
-            # quotation mark.
-            # https://en.wikipedia.org/wiki/Wikipedia:Manual_of_Style/Persian
-            # https://en.wikipedia.org/wiki/Wikipedia:Manual_of_Style/Arabic
-            elif word_list[i + 1] == "’":
-                # For example "Āb Anbār-e Pā’īn" must be parsed as three words.
-                if unicode_letters_plus_dashes_re.search(word_list[i]) and unicode_letters_plus_dashes_re.search(word_list[i + 2]):
-                    word_list[i] = word_list[i] + word_list[i + 1] + word_list[i + 2]
-                    del word_list[i + 2]
-                    del word_list[i + 1]
-
-        # Four-token sequences
-        if i < len(word_list) - 3:
-            if word_list[i] == "&" and word_list[i + 1] == "#" and word_list[i + 3] == ";":
-                consolidated = "&#%s;" % word_list[i + 2]
-                if consolidated in article_text:
-                    word_list[i] = consolidated
-                    del word_list[i + 3]
-                    del word_list[i + 2]
-                    del word_list[i + 1]
-
-            elif word_list[i] == "<" and word_list[i + 1] == "/" and word_list[i + 3] == ">":
-                consolidated = "</%s>" % word_list[i + 2]
-                if consolidated in article_text:
-                    word_list[i] = consolidated
-                    del word_list[i + 3]
-                    del word_list[i + 2]
-                    del word_list[i + 1]
-
-            elif word_list[i] == "<" and word_list[i + 2] == "/" and word_list[i + 3] == ">":
-                consolidated = "<%s/>" % word_list[i + 1]
-                if consolidated in article_text:
-                    word_list[i] = consolidated
-                    del word_list[i + 3]
-                    del word_list[i + 2]
-                    del word_list[i + 1]
-
-        i += 1
+                word_list.extend((word, None) for word in tokenize(param))
 
     # -- Main spellcheck loop --
 
-    for word_mixedcase in word_list:
+    for (word_token, word_offset) in word_list:
 
         # "." is specifically excluded from the below list, due to
         # abbreviations which are handled correctly by spell.py with
         # periods in place.
-        word_mixedcase = word_mixedcase.strip(
+        word_mixedcase = word_token.strip(
             # Deal with symmetrical wiki markup
             "=" +
-            # Deal with NLTK treatment of hyphenated and slashed words
+            # Deal with tokenizer treatment of hyphenated and slashed words
             "––/-" +
 
-            # TODO: NLTK tokenizer breaks on British quoting style
-            # (which is allowed in a small number of circumstances): 'xxx'
+            # TODO: Tokenizer breaks on British quoting style (which
+            # is allowed in a small number of circumstances): 'xxx'
             "'"
 
             # https://en.wikipedia.org/wiki/%CA%BBOkina#Names
-            # TODO: NLTK tokenizer breaks on Polynesian words using
+            # TODO: Tokenizer breaks on Polynesian words using
             # apostrophes and quote marks to represent 'eta and other
             # glottal stops.  Hawaiian words should use ʻokina which
             # are tokenized correctly, as a letter.
@@ -462,14 +404,26 @@ def spellcheck_all_langs(article_title, article_text, wiktionary=False, include_
         # Deal with asymmetrical wiki markup
         word_mixedcase = word_mixedcase.lstrip(":")
 
+        # Unattested forms like "''*tuqlid''" are not eligible for
+        # dictionary entries.  The meaning of these strings should be
+        # clear in context, so no need to report them.  Italics are
+        # gone from article_text, so look for them in the wikitext
+        # (tokens from wikt_trans_re have no offset).  Most "*" tokens
+        # are list markup, so only map this token back to where it
+        # came from (which means converting the article again) if the
+        # italic form is there and isn't the only "*" + word_mixedcase.
         if word_mixedcase.startswith("*"):
             word_mixedcase = word_mixedcase.lstrip("*")
-            if re.search(r"''\*" + word_mixedcase + r"''", article_text):
-                # Unattested forms like "''*tuqlid''" which are not
-                # eligible for dictionary entries. The meaning of
-                # these strings should be clear in context, so no need
-                # to report them.
-                continue
+            unattested_form = "''*%s''" % word_mixedcase
+            if word_mixedcase and word_offset is not None and unattested_form in article_text_orig:
+                if article_text_orig.count(unattested_form) == 1 and article_text.count("*" + word_mixedcase) == 1:
+                    continue
+                if source_offsets is None:
+                    source_offsets = get_source_offsets(article_text_orig, include_quotations)
+                source_context = article_text_orig[max(source_offsets[word_offset] - 3, 0):
+                                                   source_offsets[word_offset + len(word_token)] + 3]
+                if unattested_form in source_context:
+                    continue
 
         if not word_mixedcase.startswith("&"):
             # Let &xxx; pass through un-stripped so it's easy to identify later
@@ -479,7 +433,7 @@ def spellcheck_all_langs(article_title, article_text, wiktionary=False, include_
         if is_spelling_correct is True:
             continue
         if is_spelling_correct == "uncertain":
-            if not ignore_typo_in_context(word_mixedcase, article_text_orig):
+            if not ignore_typo_in_context(word_mixedcase, article_text_orig, context_flags):
                 if not is_chemical_formula(word_mixedcase):
                     print("G\t%s\t%s" % (word_mixedcase, article_title), flush=True)
                     # "G" for "iGnored but maybe shouldn't be"
@@ -492,7 +446,7 @@ def spellcheck_all_langs(article_title, article_text, wiktionary=False, include_
 
     # Exceptions - words and written forms not in the dictionary
     article_oops_list = [oops for oops in article_oops_list
-                         if not ignore_typo_in_context(oops, article_text_orig)]
+                         if not ignore_typo_in_context(oops, article_text_orig, context_flags)]
 
     if article_oops_list:
         article_oops_string = u"𝆃".join(article_oops_list)
@@ -516,15 +470,29 @@ def tally_misspelled_words(result):
 
     (article_title, article_oops_list) = result
     global misspelled_words
+    if misspelled_words is None:
+        misspelled_words = open_title_index()
     for word_mixedcase in article_oops_list:
         if is_chemical_formula(word_mixedcase):
             # Retain capitalization for correct word categorization later
             word_lower = word_mixedcase
         else:
             word_lower = word_mixedcase.lower()
-        (freq, existing_list) = misspelled_words.get(word_lower, (0, []))
-        existing_list.append(article_title)
-        misspelled_words[word_lower] = (len(existing_list), existing_list)
+        add_to_title_index(misspelled_words, word_lower, article_title)
+
+
+register_check("spell", spellcheck_all_langs, tally_misspelled_words, dump_results)
+
+# Per-article output lines by tag, written to separate files for
+# run_main_spell_check.sh and run_moss_parallel2.sh
+SPELL_RECORD_FILES = {
+    "@": "tmp-output-typos-by-article.txt",
+    "!": "tmp-output-parse-failures.txt",
+    "!Q": "tmp-output-straight-quotes.txt",
+    "G": "tmp-output-ignored.txt",
+    "D": "tmp-output-dashes.txt",
+    "S": "tmp-output-skipped.txt",
+}
 
 
 if __name__ == '__main__':
@@ -533,5 +501,19 @@ if __name__ == '__main__':
     if len(sys.argv) > 1:
         which_articles = sys.argv[1]
     print(f"Spell checking articles: {which_articles}", file=sys.stderr)
-    read_en_article_text(spellcheck_all_langs, process_result_callback=tally_misspelled_words, parallel="incremental", which_articles=which_articles)
+    results_file = f"article-results-spell-{which_articles}.sqlite"
+
+    # Most frequent words from the previous run are checked once here
+    # instead of once per child process
+    word_counts_file = f"spell-word-counts-{which_articles}.sqlite"
+    previous_word_counts_file = get_previous_run_file(word_counts_file)
+    if previous_word_counts_file:
+        load_verdict_table(previous_word_counts_file)
+    record_word_counts(word_counts_file)
+    register_child_flush_function(flush_word_counts)
+
+    read_en_article_text(spellcheck_all_langs, process_result_callback=tally_misspelled_words, parallel="sharded", which_articles=which_articles,
+                         results_file=get_results_file(results_file), previous_results_file=get_previous_results_file(results_file),
+                         record_files=SPELL_RECORD_FILES)
+    print_verdict_cache_stats()
     dump_results()
@@ -6,7 +6,7 @@ import sys
 import time
 from xml.sax.saxutils import unescape
 
-from moss_dump_analyzer import read_en_article_text
+from moss_dump_analyzer import read_en_article_text, register_check
 from moss_entity_check import skip_article_strings
 from wikitext_util import get_main_body_wikitext
 
@@ -3499,6 +3499,10 @@ def full_regex_callback(article_title, article_text):
             # pprint(hits_sorted)
 
 
-print(f"Starting RETF scan {datetime.datetime.now().isoformat()}", file=sys.stderr)
-read_en_article_text(full_regex_callback, parallel="incremental")
-print(f"Finished RETF scan {datetime.datetime.now().isoformat()} ", file=sys.stderr)
+register_check("retf", full_regex_callback)
+
+
+if __name__ == '__main__':
+    print(f"Starting RETF scan {datetime.datetime.now().isoformat()}", file=sys.stderr)
+    read_en_article_text(full_regex_callback, parallel="chunked")
+    print(f"Finished RETF scan {datetime.datetime.now().isoformat()} ", file=sys.stderr)
@@ -7,18 +7,21 @@ set -e
 echo "Beginning main Wikipedia spell check"
 echo `date`
 
+# Per-article lines go to tmp-output-*.txt by type (see
+# SPELL_RECORD_FILES in moss_spell_check.py); tmp-output.txt gets the
+# typos by frequency
 ../venv/bin/python3 ../moss_spell_check.py $1 > tmp-output.txt
 
 echo "Beginning word categorization run 1"
 echo `date`
 
 # Run time for this segment: ~25 min (8-core parallel)
-grep ^@ tmp-output.txt | sort -nr -k2 > /tmp/sorted_by_article.txt
+sort -nr -k2 tmp-output-typos-by-article.txt > /tmp/sorted_by_article.txt
 # Sort takes ~37sec
 cat /tmp/sorted_by_article.txt | ../venv/bin/python3 ../by_article_processor.py > tmp-articles-linked-words.txt
 rm -rf /tmp/sorted_by_article.txt
 # TODO: Can this run as one line, or is that the source of the .py command not found error?
-# grep ^@ tmp-output.txt | sort -nr -k2 | ../venv/bin/python3 ../by_article_processor.py > tmp-articles-linked-words.txt
+# sort -nr -k2 tmp-output-typos-by-article.txt | ../venv/bin/python3 ../by_article_processor.py > tmp-articles-linked-words.txt
 
 echo "Primary by-article post-processing"
 echo `date`
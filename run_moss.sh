@@ -9,6 +9,25 @@ export MOSS_USER_AGENT="mossbot/${commit_id} https://en.wikipedia.org/wiki/Wikip
 mkdir $RUN_NAME
 cd $RUN_NAME
 
+# Uncomment to cache plaintext conversions of articles on disk, shared
+# by all reports in this run and reused for unchanged articles in the
+# next dump (see wikitext_util.py).  Needs tens of GB of disk space.
+# export MOSS_TEXT_CACHE=/var/local/moss/bulk-wikipedia/enwiki-derived-text.sqlite
+
+# Uncomment to reuse spell check and entity check results from a
+# previous run directory for articles unchanged since that dump (see
+# moss_dump_analyzer.py).  Results are only reused if the code hasn't
+# changed, but dictionary updates are not noticed, so do a full run
+# without this now and then.  Also lets the main spell check look up
+# its most frequent words once up front, using word counts from the
+# previous run (see spell.py).
+# export MOSS_PREVIOUS_RUN=`ls -td ../run-* | grep -v $RUN_NAME | head -1`
+
+# Uncomment to save spell check and entity check results for a later
+# run to reuse with MOSS_PREVIOUS_RUN, on a run that doesn't reuse a
+# previous one itself (runs that do always save them).
+# export MOSS_SAVE_RESULTS=1
+
 # --- PERFORMANCE ---
 
 # If SSD becomes a bottleneck:
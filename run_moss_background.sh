@@ -24,7 +24,8 @@ grep '*' tmp-entities | perl -pe 's/\]\], \[\[/\n/g' | perl -pe 's/.*\[\[//' | p
 
 # Sometimes there can be a CPU bottleneck for parent threads, leaving
 # child threads underused, so starting two scripts at the same time
-# can be more efficient. Also, not all long calculations can be
+# can be more efficient. (Scripts using parallel="sharded" read the
+# article CSV in the child processes, which avoids most of this.) Also, not all long calculations can be
 # parallelized to use all cores.
 # ../run_moss_parallel1.sh >& thread1.log &
 # ../run_moss_parallel2.sh >& thread2.log &
@@ -17,9 +17,9 @@ echo `date`
 echo "Failure post-processing"
 echo `date`
 
-grep -P '^!\t' tmp-output.txt | perl -pe 's/.*?\t//' | sort > err-parse-failures.txt
-grep -P '^\!Q' tmp-output.txt | perl -pe 's/^\!Q\t\* \[\[(.*?)\]\].*$/$1/' | sort > jwb-straight-quotes-unbalanced.txt
-grep ^G tmp-output.txt | ../venv/bin/python3 ../rollup_ignored.py | sort -nr -k2 > debug-spellcheck-ignored.txt
+perl -pe 's/.*?\t//' tmp-output-parse-failures.txt | sort > err-parse-failures.txt
+perl -pe 's/^\!Q\t\* \[\[(.*?)\]\].*$/$1/' tmp-output-straight-quotes.txt | sort > jwb-straight-quotes-unbalanced.txt
+../venv/bin/python3 ../rollup_ignored.py < tmp-output-ignored.txt | sort -nr -k2 > debug-spellcheck-ignored.txt
 
 echo "Beginning word categorization run 2"
 echo `date`
@@ -197,7 +197,7 @@ cat tmp-words-with-articles.txt | ../venv/bin/python3 ../count_by_rating.py >> p
 echo "Beginning dash report"
 echo `date`
 
-grep ^D tmp-output.txt | perl -pe 's/^D\t'// | sort -k3 | ../venv/bin/python3 ../sectionalizer.py > debug-dashes.txt
+perl -pe 's/^D\t'// tmp-output-dashes.txt | sort -k3 | ../venv/bin/python3 ../sectionalizer.py > debug-dashes.txt
 # TODO: Are spaced emdashes more common than unspaced?  I like them
 # better but they go against the style guide. -- Beland
 #
@@ -1,76 +1,40 @@
 # -*- coding: utf-8 -*-
 
+import atexit
+from collections import Counter
+import contextlib
 import os
 import re
+import sqlite3
 from string import punctuation
 import sys
 from lru import LRU
 try:
+    from lexicon_file import word_set_contains
+    from lexicons import get_lexicon
     from wikitext_util import html_tag_re, contractions
     from unencode_entities import entities_re
 except ImportError:
+    from .lexicon_file import word_set_contains
+    from .lexicons import get_lexicon
     from .wikitext_util import html_tag_re
     from .unencode_entities import entities_re
 
-all_words = set()
 punctuation_tmp = punctuation
-punctuation_re = re.compile(r"[ " + punctuation + r"]")
 compound_separators_re = re.compile(r"[—–/\-]")
 #                                      emdash, endash, slash, hyphen
 
-
-def add_tokens(line):
-    line = line.replace("_", " ")
-    line = line.strip().lower()
-
-    # Mostly splitting on " ", but also ":", etc.
-    [all_words.add(title_word)
-     for title_word
-     in punctuation_re.split(line)
-     if title_word]
-
-    # Re-parse splitting only on " " to make sure forms like
-    # "'s" get added (for compatibility with the NLTK
-    # tokenizer)
-    [all_words.add(title_word)
-     for title_word
-     in line.split(" ")
-     if title_word]
-
-
-def load_data():
+# Words from all article and Wiktionary titles, etc.; see lexicons.py
+dictionary = None
+if not os.environ.get("NO_LOAD"):
     print("Loading spell.py dictionary...", file=sys.stderr)
+    dictionary = get_lexicon("spell")
 
-    # TODO: Possibly move this to postgres or MySQL.  Load DB as part
-    # of update_downloads.sh; startup time is very slow due to loading
-    # this all into Python, even though accessing in-memory data is
-    # very fast.
-
-    with open("/var/local/moss/bulk-wikipedia/For_Wiktionary", "r") as moss_html_file:
-        moss_html = moss_html_file.read()
-        queued_matches = re.findall('"https://en.wiktionary.org/wiki/(.*?)"', moss_html)
-        if not queued_matches:
-            raise Exception("Empty Wiktionary queue; regex broken?")
-        for queued_match in queued_matches:
-            add_tokens(queued_match)
-
-    for filename in [
-            "/var/local/moss/bulk-wikipedia/enwiktionary-latest-all-titles-in-ns0",
-            "/var/local/moss/bulk-wikipedia/enwiki-latest-all-titles-in-ns0",
-            "/var/local/moss/bulk-wikipedia/specieswiki-latest-all-titles-in-ns0",
-            "/var/local/moss/bulk-wikipedia/Wikispecies:Requested_articles",
-            "/var/local/moss/bulk-wikipedia/Before_2019",
-            "/var/local/moss/bulk-wikipedia/2020",
-            "/var/local/moss/bulk-wikipedia/2021",
-            "/var/local/moss/bulk-wikipedia/Old_case_notes",
-    ]:
-        with open(filename, "r") as title_list:
-            for line in title_list:
-                add_tokens(line)
 
-
-if not os.environ.get("NO_LOAD"):
-    load_data()
+def is_known_word(word_lower):
+    if dictionary is None:
+        return False
+    return word_set_contains(dictionary, word_lower)
 
 
 abbr_re = re.compile(r"\.\w\.$")
@@ -506,6 +470,23 @@ bad_characters = {
     # "º",
 }
 
+# Checking every entry of bad_characters against every word is slow,
+# so single characters are checked all at once as a set, and pure
+# ASCII words (the vast majority) only need checking for the few
+# ASCII substrings.
+bad_single_characters = frozenset(substring for substring in bad_characters if len(substring) == 1)
+bad_multi_character_substrings = [substring for substring in bad_characters if len(substring) > 1]
+bad_ascii_substrings = [substring for substring in bad_characters if substring.isascii()]
+
+
+def has_bad_characters(word):
+    if word.isascii():
+        return any(substring in word for substring in bad_ascii_substrings)
+    if not bad_single_characters.isdisjoint(word):
+        return True
+    return any(substring in word for substring in bad_multi_character_substrings)
+
+
 # Treated as separate words by NLTK tokenizer
 allow_list = {
 
@@ -562,7 +543,38 @@ allow_list = {
 print("Done loading spell.py data.", file=sys.stderr)
 
 
-cached_answers = LRU(10000)
+# -- Caching of answers --
+
+# For speed.  Should work well because in most articles the same
+# words are used several times, and English has a small number of
+# highly used words across all articles.
+#
+# There are two tiers.  verdict_table has answers for the most
+# frequent words from the previous run (see load_verdict_table()),
+# filled in by the parent process before child processes are forked,
+# so they all share it and it isn't lost when a child is replaced.
+# cached_answers is a per-process LRU cache for everything else.
+
+# Words from the previous run to put in verdict_table
+VERDICT_TABLE_SIZE = 200000
+
+# Per process; with CPU_COUNT processes, total memory is a multiple
+# of this.  Each entry takes about 130 bytes for a typical word.
+VERDICT_CACHE_MB = 64
+VERDICT_CACHE_BYTES_PER_ENTRY = 150
+
+# Unique words to count before writing counts out (see
+# record_word_counts())
+WORD_COUNTS_BATCH_SIZE = 100000
+
+verdict_table = {}
+cached_answers = LRU(VERDICT_CACHE_MB * 1024 * 1024 // VERDICT_CACHE_BYTES_PER_ENTRY)
+
+# Per process, since the last flush_word_counts()
+verdict_cache_stats = Counter()
+
+word_counts_file = None
+word_counts = None
 
 
 # Returns True, False, or "uncertain"
@@ -571,16 +583,94 @@ def is_word_spelled_correctly(word_mixedcase):
     if not word_mixedcase:
         return True
 
-    # For speed.  Should work well because in most articles the same
-    # words are used several times, and English has a small number of
-    # highly used words across all articles.
+    if word_counts is not None:
+        word_counts[word_mixedcase] += 1
+        if len(word_counts) >= WORD_COUNTS_BATCH_SIZE:
+            flush_word_counts()
+
+    answer = verdict_table.get(word_mixedcase)
+    if answer is not None:
+        verdict_cache_stats["table_hits"] += 1
+        return answer
     if word_mixedcase in cached_answers:
+        verdict_cache_stats["cache_hits"] += 1
         return cached_answers[word_mixedcase]
+    verdict_cache_stats["misses"] += 1
     answer = _is_word_spelled_correctly_impl(word_mixedcase)
     cached_answers[word_mixedcase] = answer
     return answer
 
 
+# Fills verdict_table with answers for the most frequent words in a
+# word counts file from a previous run.  Answers are computed fresh,
+# so changes to the dictionary since then are picked up.
+def load_verdict_table(previous_word_counts_file, size=VERDICT_TABLE_SIZE):
+    with contextlib.closing(sqlite3.connect(f"file:{previous_word_counts_file}?mode=ro", uri=True)) as db:
+        words = [word for (word,) in db.execute("SELECT word FROM word_counts ORDER BY count DESC LIMIT ?", (size,))]
+    verdict_table.clear()
+    for word in words:
+        verdict_table[word] = _is_word_spelled_correctly_impl(word)
+    print(f"Loaded {len(verdict_table)} spelling verdicts from {previous_word_counts_file}", file=sys.stderr)
+
+
+# Counts how many times each word is checked (and cache statistics)
+# and saves them to an SQLite file, for load_verdict_table() in the
+# next run.  Call in the parent process before forking; child
+# processes must call flush_word_counts() before exiting.
+def record_word_counts(filename):
+    global word_counts_file
+    global word_counts
+    if os.path.exists(filename):
+        os.remove(filename)
+    with contextlib.closing(sqlite3.connect(filename)) as db:
+        db.execute("CREATE TABLE word_counts (word TEXT NOT NULL PRIMARY KEY, count INTEGER NOT NULL) WITHOUT ROWID")
+        db.execute("CREATE TABLE cache_stats (name TEXT NOT NULL PRIMARY KEY, count INTEGER NOT NULL)")
+        db.commit()
+    word_counts_file = filename
+    word_counts = Counter()
+    verdict_cache_stats.clear()
+
+
+def flush_word_counts():
+    if word_counts is None:
+        return
+    with contextlib.closing(sqlite3.connect(word_counts_file, timeout=300)) as db:
+        with db:
+            db.executemany("INSERT INTO word_counts (word, count) VALUES (?, ?)"
+                           " ON CONFLICT (word) DO UPDATE SET count = count + excluded.count",
+                           word_counts.items())
+            db.executemany("INSERT INTO cache_stats (name, count) VALUES (?, ?)"
+                           " ON CONFLICT (name) DO UPDATE SET count = count + excluded.count",
+                           verdict_cache_stats.items())
+    word_counts.clear()
+    verdict_cache_stats.clear()
+
+
+atexit.register(flush_word_counts)
+
+
+# For tuning VERDICT_TABLE_SIZE and VERDICT_CACHE_MB.  Reports totals
+# from all processes if record_word_counts() was used, or just this
+# process otherwise.
+def print_verdict_cache_stats():
+    stats = verdict_cache_stats
+    table_coverage = ""
+    if word_counts is not None:
+        flush_word_counts()
+        with contextlib.closing(sqlite3.connect(word_counts_file)) as db:
+            stats = Counter(dict(db.execute("SELECT name, count FROM cache_stats")))
+            (total_count,) = db.execute("SELECT SUM(count) FROM word_counts").fetchone()
+            (top_count,) = db.execute("SELECT SUM(count) FROM (SELECT count FROM word_counts ORDER BY count DESC LIMIT ?)",
+                                      (VERDICT_TABLE_SIZE,)).fetchone()
+        if total_count:
+            table_coverage = f"; top {VERDICT_TABLE_SIZE} words this run are {100 * top_count / total_count:.1f}% of lookups"
+    lookup_count = sum(stats.values()) or 1
+    print(f"Spelling verdicts: {stats['table_hits']} table hits ({100 * stats['table_hits'] / lookup_count:.1f}%),"
+          f" {stats['cache_hits']} LRU hits ({100 * stats['cache_hits'] / lookup_count:.1f}%),"
+          f" {stats['misses']} misses ({100 * stats['misses'] / lookup_count:.1f}%){table_coverage}",
+          file=sys.stderr)
+
+
 def _is_word_spelled_correctly_impl(word_mixedcase):
 
     # word_lower = word_mixedcase.lower()
@@ -592,10 +682,10 @@ def _is_word_spelled_correctly_impl(word_mixedcase):
         # and/or multi-word proper nouns.
         return False
 
-    if any(substring in word_mixedcase for substring in bad_characters):
+    if has_bad_characters(word_mixedcase):
         return False
 
-    if word_mixedcase.lower() in all_words:
+    if is_known_word(word_mixedcase.lower()):
         return True
 
     if word_mixedcase in allow_list:
@@ -645,7 +735,7 @@ def _is_word_spelled_correctly_impl(word_mixedcase):
     if search_again:
         if not word_mixedcase:
             return True
-        if word_mixedcase.lower() in all_words:
+        if is_known_word(word_mixedcase.lower()):
             return True
 
     word_parts_mixedcase = compound_separators_re.split(word_mixedcase)
@@ -673,7 +763,7 @@ def _is_word_spelled_correctly_impl(word_mixedcase):
     if not all_letters_re.match(word_mixedcase):
         if period_splice_re.match(word_mixedcase):
             plus_period = "%s." % word_mixedcase.lower()
-            if plus_period in all_words:
+            if is_known_word(plus_period):
                 # Because the word segmenter often doesn't keep the
                 # trailing period with the word.  TODO: Catch situations
                 # where the trailing period is actually missing.
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+# Spelling suggestion index stored in a file that can be mapped into
+# memory and queried in place (symmetric delete method, as in
+# SymSpell).  Every word is indexed under each string that can be
+# made by deleting up to max_distance letters from its first
+# prefix_length letters; a query looks up the same deletes of its own
+# prefix, which finds every word within max_distance edits (plus some
+# that aren't, so candidates must be checked).
+#
+# File layout:
+#  header: magic, 20-byte signature of the sources it was built from
+#    (see lexicons.py), max_distance, prefix_length, word count,
+#    entry count
+#  word offsets: 32-bit offset of each word in the string table, plus
+#    one for the end of the table
+#  entries: sorted 64-bit values of (32-bit hash of delete string,
+#    8-bit word length, 24-bit word number)
+#  string table: all words in UTF-8
+
+from array import array
+import bisect
+import mmap
+import os
+import struct
+import zlib
+
+SUGGESTION_INDEX_MAGIC = b"MOSSSUG1"
+SUGGESTION_INDEX_HEADER = struct.Struct("<8s20sIIQQ")
+MAX_WORD_COUNT = 2 ** 24
+
+
+def get_deletes(word, max_distance, prefix_length):
+    deletes = {word[:prefix_length]}
+    edge = deletes
+    for distance in range(max_distance):
+        edge = {string[:i] + string[i + 1:] for string in edge for i in range(len(string))} - deletes
+        deletes |= edge
+    return deletes
+
+
+def get_delete_hash(delete):
+    return zlib.crc32(delete.encode("utf-8"))
+
+
+def write_suggestion_index(filename, words, max_distance, prefix_length, signature=b""):
+    words = sorted(words)
+    if len(words) >= MAX_WORD_COUNT:
+        raise Exception(f"Too many words for {filename}")
+
+    # Bucketed by the top byte of the hash so no one sort needs a
+    # list of every entry
+    buckets = [array("Q") for i in range(256)]
+    offsets = array("I", [0])
+    strings = []
+    for (word_number, word) in enumerate(words):
+        word_bytes = word.encode("utf-8")
+        strings.append(word_bytes)
+        offsets.append(offsets[-1] + len(word_bytes))
+        word_tag = (min(len(word), 255) << 24) | word_number
+        for delete in get_deletes(word.lower(), max_distance, prefix_length):
+            delete_hash = get_delete_hash(delete)
+            buckets[delete_hash >> 24].append((delete_hash << 32) | word_tag)
+
+    # Write and rename so readers never see a partial file
+    tmp_filename = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_filename, "wb") as index_file:
+        entry_count = sum(len(bucket) for bucket in buckets)
+        index_file.write(SUGGESTION_INDEX_HEADER.pack(SUGGESTION_INDEX_MAGIC, signature, max_distance,
+                                                      prefix_length, len(words), entry_count))
+        offsets.tofile(index_file)
+        for bucket in buckets:
+            array("Q", sorted(bucket)).tofile(index_file)
+        for word_bytes in strings:
+            index_file.write(word_bytes)
+    os.replace(tmp_filename, filename)
+
+
+# Returns None if filename is missing or not a suggestion index
+def read_suggestion_index_signature(filename):
+    try:
+        with open(filename, "rb") as index_file:
+            header = index_file.read(SUGGESTION_INDEX_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < SUGGESTION_INDEX_HEADER.size:
+        return None
+    (magic, signature, max_distance, prefix_length, word_count, entry_count) = SUGGESTION_INDEX_HEADER.unpack(header)
+    if magic != SUGGESTION_INDEX_MAGIC:
+        return None
+    return signature
+
+
+# Returns an opaque value to pass to get_suggestion_candidates()
+def open_suggestion_index(filename):
+    with open(filename, "rb") as index_file:
+        mapped = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+    (magic, signature, max_distance, prefix_length, word_count, entry_count) = SUGGESTION_INDEX_HEADER.unpack_from(mapped, 0)
+    if magic != SUGGESTION_INDEX_MAGIC:
+        raise Exception(f"{filename} is not a suggestion index")
+    offsets_start = SUGGESTION_INDEX_HEADER.size
+    entries_start = offsets_start + 4 * (word_count + 1)
+    strings_start = entries_start + 8 * entry_count
+    offsets = memoryview(mapped)[offsets_start:entries_start].cast("I")
+    entries = memoryview(mapped)[entries_start:strings_start].cast("Q")
+    return (mapped, offsets, entries, strings_start, max_distance, prefix_length)
+
+
+# Returns the set of indexed words which might be within max_distance
+# edits of word (compared in lowercase).  Words more than max_distance
+# letters longer or shorter are left out.
+def get_suggestion_candidates(suggestion_index, word, max_distance):
+    (mapped, offsets, entries, strings_start, index_max_distance, prefix_length) = suggestion_index
+    if max_distance > index_max_distance:
+        raise Exception(f"Suggestion index only goes up to edit distance {index_max_distance}")
+
+    word_numbers = set()
+    for delete in get_deletes(word.lower(), max_distance, prefix_length):
+        delete_hash = get_delete_hash(delete)
+        position = bisect.bisect_left(entries, delete_hash << 32)
+        while position < len(entries) and entries[position] >> 32 == delete_hash:
+            entry = entries[position]
+            if abs(((entry >> 24) & 0xff) - len(word)) <= max_distance:
+                word_numbers.add(entry & 0xffffff)
+            position += 1
+
+    return {mapped[strings_start + offsets[word_number]:strings_start + offsets[word_number + 1]].decode("utf-8")
+            for word_number in word_numbers}
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+# Index of article titles by key (like the typos found by
+# moss_spell_check.py), for collecting more (key, title) pairs than
+# fit in memory.  Only the number of times each key was added is kept
+# in memory; pairs are buffered up to a memory budget, then sorted and
+# written to a temporary "run" file.  Reading the index back merges
+# the runs (a k-way merge), so memory use stays bounded no matter how
+# many articles share a key.
+#
+# Run files are tab-separated lines, so keys and titles can't contain
+# tabs or newlines (article titles and tokenized words don't).
+
+import heapq
+from itertools import groupby
+import os
+import tempfile
+
+TITLE_INDEX_MEMORY_MB = 256
+
+# Rough size in memory of a buffered (key, title) pair, on top of the
+# strings themselves
+TITLE_INDEX_BYTES_PER_PAIR = 120
+
+# Runs are merged together when there get to be this many, to keep
+# the number of open files down
+MAX_RUN_COUNT = 64
+
+
+# Returns an opaque value to pass to the other functions.  Run files
+# go in a temporary directory under directory, which is removed by
+# close_title_index().
+def open_title_index(directory=".", memory_mb=TITLE_INDEX_MEMORY_MB):
+    return {
+        "key_counts": {},
+        "pairs": [],
+        "pairs_bytes": 0,
+        "memory_limit": memory_mb * 1024 * 1024,
+        "directory": tempfile.mkdtemp(prefix="title-index-", dir=directory),
+        "runs": [],
+        "runs_written": 0,
+    }
+
+
+def add_to_title_index(title_index, key, title):
+    title_index["key_counts"][key] = title_index["key_counts"].get(key, 0) + 1
+    title_index["pairs"].append((key, title))
+    title_index["pairs_bytes"] += len(key) + len(title) + TITLE_INDEX_BYTES_PER_PAIR
+    if title_index["pairs_bytes"] >= title_index["memory_limit"]:
+        spill_title_index(title_index)
+
+
+def write_run(title_index, rows):
+    filename = os.path.join(title_index["directory"], f"run-{title_index['runs_written']}.tsv")
+    title_index["runs_written"] += 1
+    with open(filename, "w") as run_file:
+        previous_row = None
+        for row in rows:
+            # Duplicate pairs only need to be kept once
+            if row != previous_row:
+                run_file.write("\t".join(row) + "\n")
+            previous_row = row
+    return filename
+
+
+def read_run(filename):
+    with open(filename, "r") as run_file:
+        for line in run_file:
+            yield tuple(line.rstrip("\n").split("\t"))
+
+
+# Writes buffered pairs to a sorted run file
+def spill_title_index(title_index):
+    if not title_index["pairs"]:
+        return
+    title_index["pairs"].sort()
+    title_index["runs"].append(write_run(title_index, title_index["pairs"]))
+    title_index["pairs"] = []
+    title_index["pairs_bytes"] = 0
+
+    if len(title_index["runs"]) >= MAX_RUN_COUNT:
+        merged_filename = write_run(title_index, heapq.merge(*[read_run(filename) for filename in title_index["runs"]]))
+        for filename in title_index["runs"]:
+            os.remove(filename)
+        title_index["runs"] = [merged_filename]
+
+
+# Generates (key, number of times added, sorted list of unique titles)
+# for each key, in order of key
+def title_index_items(title_index):
+    title_index["pairs"].sort()
+    merged = heapq.merge(iter(title_index["pairs"]), *[read_run(filename) for filename in title_index["runs"]])
+    for (key, pairs) in groupby(merged, key=lambda pair: pair[0]):
+        titles = []
+        for (pair_key, title) in pairs:
+            if not titles or titles[-1] != title:
+                titles.append(title)
+        yield (key, title_index["key_counts"][key], titles)
+
+
+def close_title_index(title_index):
+    for filename in title_index["runs"]:
+        os.remove(filename)
+    os.rmdir(title_index["directory"])
+    title_index["runs"] = []
+    title_index["pairs"] = []
@@ -1967,25 +1967,168 @@ def make_character_or_ignore(entity):
     return character
 
 
+# -- Replacing many strings at once --
+
+# Replacing each string in turn with str.replace() rescans the text
+# once per string, which adds up to about a thousand scans per line or
+# article.  Instead, consecutive replacements that can't interfere
+# with each other (neither string contains the other or overlaps its
+# start or end) are merged into one regex, applied in one pass.  If
+# that leaves anything the run would replace (a replacement made a new
+# match, like "&ap;" -> "&approx;"), the run is redone one string at a
+# time, so output is always the same as replacing in order.
+#
+# The regex engine can only skip ahead to where a match might start if
+# every alternative starts with a character in the Basic Multilingual
+# Plane, so strings starting with characters beyond it (like the
+# mathematical alphanumerics) go in runs of their own.
+
+def is_astral(character):
+    return ord(character) > 0xFFFF
+
+
+# Whether from_string can't interfere with any string in run
+def fits_in_run(run, from_string):
+    if is_astral(from_string[0]) != run["astral"]:
+        return False
+    if from_string in run["joined"]:
+        return False
+    for start in range(len(from_string)):
+        for end in range(start + 1, len(from_string) + 1):
+            if from_string[start:end] in run["replacements"]:
+                return False
+    for length in range(1, len(from_string)):
+        if from_string[length:] in run["prefixes"] or from_string[:length] in run["suffixes"]:
+            return False
+    return True
+
+
+# Returns a regex character class matching characters, with
+# consecutive code points as ranges, which the regex engine checks
+# much faster than a long list of characters
+def make_character_class(characters):
+    ranges = []
+    for code_point in sorted(set(ord(character) for character in characters)):
+        if ranges and ranges[-1][1] == code_point - 1:
+            ranges[-1][1] = code_point
+        else:
+            ranges.append([code_point, code_point])
+    return "[" + "".join(re.escape(chr(first)) if first == last else re.escape(chr(first)) + "-" + re.escape(chr(last))
+                         for (first, last) in ranges) + "]"
+
+
+# Returns a regex alternation matching strings, with common first
+# characters factored out (as in a trie) so fewer alternatives are
+# tried at each position.  No string may be a prefix of another.
+def make_trie_pattern(strings):
+    if len(strings) == 1:
+        return re.escape(strings[0])
+    # Alternatives have to start with plain characters, not a class,
+    # for the regex engine to skip ahead to where one might start
+    if all(len(string) == 1 for string in strings):
+        return make_character_class(strings)
+    rests_by_first = {}
+    for string in strings:
+        rests_by_first.setdefault(string[0], []).append(string[1:])
+    alternatives = []
+    for (first, rests) in rests_by_first.items():
+        if len(rests) == 1:
+            alternatives.append(re.escape(first + rests[0]))
+        else:
+            alternatives.append(re.escape(first) + "(?:" + make_trie_pattern(rests) + ")")
+    return "|".join(alternatives)
+
+
+non_ascii_re = re.compile(r"[^\x00-\x7f]")
+
+
+# Returns [(first characters of the run's strings if none are ASCII,
+# regex, {from_string: to_string})] for replace_strings_in_order()
+def make_replacement_runs(replacement_pairs):
+    runs = []
+    for (from_string, to_string) in replacement_pairs:
+        if not runs or not fits_in_run(runs[-1], from_string):
+            runs.append({"replacements": {}, "joined": "", "prefixes": set(), "suffixes": set(),
+                         "astral": is_astral(from_string[0])})
+        run = runs[-1]
+        run["replacements"][from_string] = to_string
+        run["joined"] += "\0" + from_string
+        for length in range(1, len(from_string)):
+            run["prefixes"].add(from_string[:length])
+            run["suffixes"].add(from_string[length:])
+
+    replacement_runs = []
+    for run in runs:
+        first_characters = frozenset(from_string[0] for from_string in run["replacements"])
+        if any(character.isascii() for character in first_characters):
+            first_characters = None
+        replacement_runs.append((first_characters,
+                                 re.compile(make_trie_pattern(list(run["replacements"]))),
+                                 run["replacements"]))
+    return replacement_runs
+
+
+# Same as calling text.replace(from_string, to_string) for each pair
+# given to make_replacement_runs(), in order
+def replace_strings_in_order(text, replacement_runs):
+    # Most runs only replace non-ASCII characters, and most text has
+    # few of those, so runs that can't match are skipped without
+    # scanning the text
+    non_ascii_characters = None
+
+    for (first_characters, run_re, replacements) in replacement_runs:
+        if first_characters:
+            if non_ascii_characters is None:
+                non_ascii_characters = set() if text.isascii() else set(non_ascii_re.findall(text))
+            if first_characters.isdisjoint(non_ascii_characters):
+                continue
+
+        (new_text, count) = run_re.subn(lambda match: replacements[match.group()], text)
+        if not count:
+            continue
+        if run_re.search(new_text):
+            for (from_string, to_string) in replacements.items():
+                text = text.replace(from_string, to_string)
+        else:
+            text = new_text
+        non_ascii_characters = None
+    return text
+
+
+# Built when first needed, after transform_unsafe may have been added
+# to transform below.  Keys are transform_greek.
+conversion_runs = {}
+keep_runs = {}
+
+
+def get_fix_text_runs(transform_greek):
+    if transform_greek not in conversion_runs:
+        if transform_greek:
+            conversion_dict = transform.copy()
+            conversion_dict.update(greek_letters)
+            conversion_dict.update(controversial)
+        else:
+            conversion_dict = transform
+        conversion_runs[transform_greek] = make_replacement_runs(conversion_dict.items())
+
+        # Strings to leave alone when looking for other entities
+        keep_strings = list(keep)
+        if not transform_greek:
+            keep_strings.extend(greek_letters)
+        keep_runs[transform_greek] = make_replacement_runs([(string, "") for string in keep_strings])
+    return (conversion_runs[transform_greek], keep_runs[transform_greek])
+
+
 def fix_text(text, transform_greek=False):
+    (conversion_runs_for_text, keep_runs_for_text) = get_fix_text_runs(transform_greek)
+    new_text = replace_strings_in_order(text, conversion_runs_for_text)
 
-    if transform_greek:
-        conversion_dict = transform.copy()
-        conversion_dict.update(greek_letters)
-        conversion_dict.update(controversial)
-    else:
-        conversion_dict = transform
-
-    new_text = text
-    for (from_string, to_string) in conversion_dict.items():
-        new_text = new_text.replace(from_string, to_string)
-
-    test_string = new_text
-    for string in keep:
-        test_string = test_string.replace(string, "")
-    if not transform_greek:
-        for string in greek_letters:
-            test_string = test_string.replace(string, "")
+    # Removing strings can't add an "&", so without one there are no
+    # other entities to find
+    if "&" not in new_text:
+        return new_text
+
+    test_string = replace_strings_in_order(new_text, keep_runs_for_text)
     for unknown_entity in re.findall("&#?[a-zA-Z0-9]+;", test_string):
         character = make_character_or_ignore(unknown_entity)
         if character is not None:
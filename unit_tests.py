@@ -1,14 +1,25 @@
 from collections import defaultdict
+import os
 from pprint import pformat
+import re
+import tempfile
 import unittest
 
 # Enabling this makes init fast but breaks spelling tests
-# import os
 # os.environ["NO_LOAD"] = "1"
-from .spell import is_word_spelled_correctly  # noqa: E402
+from .lexicon_file import open_word_set, word_set_contains, write_word_set  # noqa: E402
+from .spell import has_bad_characters, is_word_spelled_correctly  # noqa: E402
+from .suggestion_index import get_suggestion_candidates, open_suggestion_index, write_suggestion_index  # noqa: E402
 
-from .wikitext_util import remove_structure_nested, wikitext_to_plaintext  # noqa: E402
+from .title_index import add_to_title_index, close_title_index, open_title_index, title_index_items  # noqa: E402
+from .unencode_entities import make_replacement_runs, replace_strings_in_order  # noqa: E402
+from .wikitext_util import (apply_substitution_steps, compile_substitution_steps, count_markup,  # noqa: E402
+                            get_main_body_paragraphs, get_main_body_view, get_main_body_view_paragraphs,
+                            get_main_body_wikitext, get_markup_excerpts, get_trigger_character, parse_main_body,
+                            remove_structure_nested,
+                            wikitext_to_plaintext, wikitext_to_plaintext_with_offsets)
 from .word_categorizer import (letters_introduced_alphabetically, make_suggestion_dict, make_edits_lowfi)  # noqa: E402
+from .word_tokenizer import tokenize, tokenize_with_offsets  # noqa: E402
 
 
 class WikitextUtilTest(unittest.TestCase):
@@ -50,6 +61,10 @@ iii"""
             remove_structure_nested("{{xxx yyy}} zzz", "{{", "}}"),
             "✂ zzz")
 
+        self.assertEqual(
+            remove_structure_nested("bbb {{ccc}} ddd}} eee {{fff", "{{", "}}"),
+            "bbb ✂ ddd}} eee fff")
+
     def test_links(self):
         self.assertEqual(
             wikitext_to_plaintext("[[Regular page]]s"),
@@ -66,6 +81,47 @@ iii"""
             wikitext_to_plaintext("*''[[Face to Face (1996 Face to Face album)|Face to Face]]'' (1996)"),
             "*Face to Face (1996)")
 
+    def test_offsets(self):
+        text_in = "{{lang|x}} [[Target page|Display text]] &Alpha; H<sub>2</sub>O"
+        (text_out, offsets) = wikitext_to_plaintext_with_offsets(text_in)
+        self.assertEqual(text_out, wikitext_to_plaintext(text_in))
+        self.assertEqual(len(offsets), len(text_out) + 1)
+        display_offset = text_out.index("Display text")
+        self.assertEqual(offsets[display_offset], text_in.index("Display text"))
+        self.assertEqual(text_in[offsets[text_out.index("O")]], "O")
+
+    def test_main_body_views(self):
+        text = 'Intro "quoted" (aside) text.\n* item\n== See also ==\n* [[Other]]'
+        main_body = parse_main_body(text)
+        self.assertEqual(get_main_body_view(main_body, "no_quotations")[0], "Intro ✂ (aside) text.\n* item\n")
+        self.assertEqual(get_main_body_paragraphs(main_body, "prose"), ["Intro ✂  text.", ""])
+        self.assertEqual(get_main_body_view(main_body, "with_quotations")[0],
+                         get_main_body_wikitext(text, include_quotations=True))
+        self.assertEqual(get_main_body_view_paragraphs(text, "prose"), get_main_body_paragraphs(main_body, "prose"))
+
+    def test_leftover_markup(self):
+        text = "xxx {{yyy {{zzz}} \"aaa"
+        self.assertEqual(count_markup(text, ["{{", "}}", '"', "<ref"]), {"{{": 2, "}}": 1, '"': 1, "<ref": 0})
+        self.assertEqual(get_markup_excerpts(text, "{{", context_length=3), ["xx {{yyy", " {{zzz"])
+
+    def test_substitution_steps(self):
+        rules = [
+            (re.compile("&ab;"), "b"),
+            (re.compile("&a"), "&"),
+            (re.compile("&c;", flags=re.I), "c"),
+            (re.compile(r"<x[^>]*>"), ""),
+        ]
+        steps = compile_substitution_steps(rules)
+        self.assertEqual([trigger for (trigger, _, _, _) in steps], ["&", "&", "<"])
+        self.assertEqual(get_trigger_character(re.compile(r"\s*\n+x?")), "\n")
+        self.assertIsNone(get_trigger_character(re.compile("a|b")))
+        # "&a" makes a new match of "&C;", as one rule at a time would
+        text = "&aab; &aC; <xy>z"
+        expected = text
+        for (regex, replacement) in rules:
+            expected = regex.sub(replacement, expected)
+        self.assertEqual(apply_substitution_steps(steps, text, None)[0], expected)
+
     def test_ŁośVaught(self):
         # From https://en.wikipedia.org/wiki/Łoś–Vaught test
         text_in = "a satisfiable theory is [[Morley's categoricity theorem|{{mvar|&kappa;}}-categorical]] (there exists an infinite cardinal {{mvar|&kappa;}} such that)"
@@ -236,8 +292,85 @@ class SpellTest(unittest.TestCase):
         # Non-ASCII capitals make it a proper noun
         self.assertTrue(is_word_spelled_correctly("Ḩasan"))
 
+    def test_bad_characters(self):
+        self.assertFalse(has_bad_characters("office"))
+        self.assertFalse(has_bad_characters("naïve"))
+        self.assertTrue(has_bad_characters("oﬃce"))
+        self.assertTrue(has_bad_characters("x²"))
+        self.assertTrue(has_bad_characters("{{cquote"))
+        self.assertTrue(has_bad_characters("{{cquote|«x»"))
+
     def period_splices(self):
         self.assertFalse(is_word_spelled_correctly("again.The"))
         self.assertFalse(is_word_spelled_correctly("Everest.Another"))
         self.assertTrue(is_word_spelled_correctly("Ph.B"))
         self.assertEqual(is_word_spelled_correctly("Im.C23", "uncertain"))
+
+
+class LexiconFileTest(unittest.TestCase):
+
+    def test_word_set(self):
+        words = {"cat", "cats", "naïve", "o'clock", "x-ray"}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "words.bin")
+            write_word_set(filename, words)
+            word_set = open_word_set(filename)
+            for word in words:
+                self.assertTrue(word_set_contains(word_set, word))
+            for word in ["ca", "catss", "naive", "", "cat\ncats"]:
+                self.assertFalse(word_set_contains(word_set, word))
+
+    def test_suggestion_index(self):
+        words = ["receive", "recipe", "deceive", "Capital", "cat"]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "suggestions.bin")
+            write_suggestion_index(filename, words, 2, 7)
+            suggestion_index = open_suggestion_index(filename)
+            self.assertIn("receive", get_suggestion_candidates(suggestion_index, "recieve", 1))
+            self.assertIn("Capital", get_suggestion_candidates(suggestion_index, "capitol", 1))
+            self.assertNotIn("cat", get_suggestion_candidates(suggestion_index, "recieve", 2))
+            self.assertIn("deceive", get_suggestion_candidates(suggestion_index, "recieve", 2))
+
+    def test_title_index(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Tiny memory budget so every pair is spilled to a run
+            title_index = open_title_index(tmp_dir, memory_mb=0)
+            for (key, title) in [("teh", "B"), ("adn", "A"), ("teh", "A"), ("teh", "B")]:
+                add_to_title_index(title_index, key, title)
+            self.assertEqual(list(title_index_items(title_index)),
+                             [("adn", 1, ["A"]), ("teh", 3, ["A", "B"])])
+            close_title_index(title_index)
+
+
+class UnencodeEntitiesTest(unittest.TestCase):
+
+    def test_replace_strings_in_order(self):
+        replacement_pairs = [("&ap;", "&approx;"), ("&approx;", "≈"), ("𝕒", "a"), ("ab", "c"), ("b", "d")]
+        runs = make_replacement_runs(replacement_pairs)
+        for text in ["&ap; &approx;", "𝕒b ab", "xyz", ""]:
+            expected = text
+            for (from_string, to_string) in replacement_pairs:
+                expected = expected.replace(from_string, to_string)
+            self.assertEqual(replace_strings_in_order(text, runs), expected)
+
+
+class WordTokenizerTest(unittest.TestCase):
+
+    def test_tokenize(self):
+        self.assertEqual(
+            tokenize("The U.S. Army didn't use 1,000 men."),
+            ["The", "U.S.", "Army", "did", "n't", "use", "1,000", "men", "."])
+        self.assertEqual(
+            tokenize("AT&T; &amp; &#160; <br/> </b> Anbār-e Pā’īn"),
+            ["AT", "&", "T", ";", "&amp;", "&#160;", "<br/>", "</b>", "Anbār-e", "Pā’īn"])
+        self.assertEqual(
+            tokenize("x*y *tuqlid"),
+            ["x", "*", "y", "*tuqlid"])
+        self.assertEqual(
+            tokenize_with_offsets("It is approx. 5 m. Etc.", keep_period=lambda token: token.lower() == "etc."),
+            [("It", 0), ("is", 3), ("approx", 6), (".", 12), ("5", 14), ("m", 16), (".", 17), ("Etc.", 19)])
+
+    def test_offsets(self):
+        text = "xxx,yyy  it's..."
+        for (token, offset) in tokenize_with_offsets(text):
+            self.assertEqual(text[offset:offset + len(token)], token)
@@ -9,6 +9,8 @@ echo `date`
 
 rm -f enwiki-latest-pages-articles-multistream.xml.bz2
 wget -o - --no-verbose https://dumps.wikimedia.org/enwiki/latest/enwiki-latest-pages-articles-multistream.xml.bz2
+rm -f enwiki-latest-pages-articles-multistream-index.txt.bz2
+wget -o - --no-verbose https://dumps.wikimedia.org/enwiki/latest/enwiki-latest-pages-articles-multistream-index.txt.bz2
 
 # Wait until here to kick this off to keep only one dump server
 # connection at a time
@@ -21,9 +23,12 @@ cd /var/local/moss/bulk-wikipedia/
 echo `date`
 echo "Decompressing enwiki multistream and converting XML to CSV..."
 cd $ORIG_DIR
-# Run time: About 4 hours (on big-bucks)
-bunzip2 -c /var/local/moss/bulk-wikipedia/enwiki-latest-pages-articles-multistream.xml.bz2 | venv/bin/python3 xml_to_csv.py /var/local/moss/bulk-wikipedia/enwiki
+# Run time: About 4 hours (on big-bucks) when run as
+#  bunzip2 -c ... | xml_to_csv.py
+# now decompresses and converts bz2 streams in parallel.
+venv/bin/python3 xml_to_csv.py /var/local/moss/bulk-wikipedia/enwiki /var/local/moss/bulk-wikipedia/enwiki-latest-pages-articles-multistream.xml.bz2 /var/local/moss/bulk-wikipedia/enwiki-latest-pages-articles-multistream-index.txt.bz2
 rm -f /var/local/moss/bulk-wikipedia/enwiki-latest-pages-articles-multistream.xml.bz2
+rm -f /var/local/moss/bulk-wikipedia/enwiki-latest-pages-articles-multistream-index.txt.bz2
 # 1 Aug 2023: .xml.bz2 20GB, .xml 90GB, .csv 54GB
 
 echo `date`
@@ -88,5 +88,12 @@ echo "Decompressing enwiktionary multistream and converting XML to CSV..."
 bunzip2 -c /var/local/moss/bulk-wikipedia/enwiktionary-latest-pages-articles-multistream.xml.bz2 | venv/bin/python3 xml_to_csv.py /var/local/moss/bulk-wikipedia/enwiktionary
 rm -f /var/local/moss/bulk-wikipedia/enwiktionary-latest-pages-articles-multistream.xml.bz2
 
+# Needs the title lists above and the special pages from parallel1
+# (which has long finished by now).  english_words is built at the end
+# of parallel5.
+echo `date`
+echo "Building lexicons..."
+venv/bin/python3 lexicons.py spell all_wiktionaries species_words transliterations
+
 echo `date`
 echo "Done."
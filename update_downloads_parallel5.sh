@@ -33,5 +33,9 @@ cd $ORIG_DIR
 venv/bin/python3 extract_english.py > /var/local/moss/bulk-wikipedia/english_words_only.txt
 # Run time: ~1 h 10 min
 
+echo `date`
+echo "Building lexicons..."
+venv/bin/python3 lexicons.py english_words suggestions
+
 echo `date`
 echo "Done."
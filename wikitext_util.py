@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
 
+from array import array
+import atexit
+import hashlib
+import os
 import re
+import sqlite3
 
 contractions = {
     # Sourced from
@@ -156,63 +161,133 @@ ignore_tags_re = re.compile(r"{{\s*(([Cc]opy|[Mm]ove|[Cc]opy section) to \w+"
                             r"|[Hh]ow\-?to).*?}}")
 
 
+# -- Offset maps --
+
+# An offset map has an entry for each character of text derived from
+# wikitext (plus one for the end of the text) giving the offset in the
+# wikitext of the character it came from.  Text inserted by a
+# substitution maps to the start of the text it replaced, unless it
+# was copied from there (like the display text of a link).  Offsets
+# never decrease.
+#
+# The *_with_offsets() functions take and return an offset map along
+# with the text; if offsets is None, they return None and skip the
+# extra work.
+
+def make_offset_map(string):
+    return array("I", range(len(string) + 1))
+
+
+def substitute_with_offsets(regex, replacement, string, offsets):
+    if offsets is None:
+        return (regex.sub(replacement, string), None)
+
+    pieces = []
+    new_offsets = array("I")
+    position = 0
+    for match in regex.finditer(string):
+        (start, end) = match.span()
+        pieces.append(string[position:start])
+        new_offsets.extend(offsets[position:start])
+        if callable(replacement):
+            replaced = replacement(match)
+        else:
+            replaced = match.expand(replacement)
+        pieces.append(replaced)
+        copied_from = match.group().find(replaced) if replaced else -1
+        if copied_from >= 0:
+            new_offsets.extend(offsets[start + copied_from:start + copied_from + len(replaced)])
+        else:
+            new_offsets.extend([offsets[start]] * len(replaced))
+        position = end
+    if not pieces:
+        return (string, offsets)
+    pieces.append(string[position:])
+    new_offsets.extend(offsets[position:])
+    return ("".join(pieces), new_offsets)
+
+
 def remove_structure_nested(string, open_string, close_string):
-    # TODO: Write tests
+    return remove_structure_nested_with_offsets(string, open_string, close_string, None)[0]
+
+
+def remove_structure_nested_with_offsets(string, open_string, close_string, offsets):
     # Sample inputs and outputs:
-    # ("aaa {{bbb {{ccc}} ddd}} eee", "{{, "}}") -> "aaa  eee"
-    # ("bbb {{ccc}} ddd}} eee", "{{, "}}") -> "bbb  ddd}} eee"
+    # ("aaa {{bbb {{ccc}} ddd}} eee", "{{, "}}") -> "aaa ✂✂✂ eee"
+    # ("bbb {{ccc}} ddd}} eee", "{{, "}}") -> "bbb ✂ ddd}} eee"
 
-    string_clean = ""
-    nesting_depth = 0
+    if open_string not in string:
+        return (string, offsets)
 
-    # Use iteration instead of recursion to avoid exceeding maximum
-    # recursion depth in articles with more than 500 template
-    # instances
-    while open_string in string:
-        open_index = string.find(open_string)  # Always > -1 inside this loop
-        close_index = string.find(close_string)
+    # Pieces of the output, joined at the end
+    clean_pieces = []
+    nesting_depth = 0
 
+    # Scan position in string, and offset map for the output
+    position = 0
+    clean_offsets = array("I")
+
+    # Next occurrence of each delimiter at or after position (-1 if
+    # none), only searched for again once position passes it, so the
+    # scan is linear however many templates there are.  Uses iteration
+    # instead of recursion to avoid exceeding maximum recursion depth
+    # in articles with more than 500 template instances.
+    open_index = string.find(open_string)
+    close_index = string.find(close_string)
+    while open_index > -1:
         if nesting_depth == 0:
             # Save text to the beginning of the template and open a new one
-            string_clean += string[:open_index]
-            string = string[open_index+2:]
+            clean_pieces.append(string[position:open_index])
+            if offsets is not None:
+                clean_offsets.extend(offsets[position:open_index])
+            position = open_index + 2
             nesting_depth += 1
-            continue
-
-        # nesting_depth > 0 from here on...
 
-        if close_index == -1 and nesting_depth > 0:
+        elif close_index == -1:
             # Unbalanced (too many open_string)
             # Drop string
-            return string_clean
-
-        if close_index > -1 and nesting_depth > 0:
+            if offsets is None:
+                return ("".join(clean_pieces), None)
+            clean_offsets.append(offsets[position])
+            return ("".join(clean_pieces), clean_offsets)
+
+        else:
+            if offsets is not None:
+                clean_offsets.append(offsets[position])
+            clean_pieces.append("✂")
             if close_index < open_index:
                 # Discard text to the end of the template, close it,
                 # and check for further templates
-                string_clean += "✂"
-                string = string[close_index+2:]
+                position = close_index + 2
                 nesting_depth -= 1
-                continue
             else:
                 # Discard text to the beginning of the template and
                 # open a new one
-                string_clean += "✂"
-                string = string[open_index+2:]
+                position = open_index + 2
                 nesting_depth += 1
-                continue
 
-    while nesting_depth > 0 and close_string in string:
+        if open_index < position:
+            open_index = string.find(open_string, position)
+        if -1 < close_index < position:
+            close_index = string.find(close_string, position)
+
+    while nesting_depth > 0 and close_index > -1:
         # Remove this template and close
-        string_clean += "✂"
-        close_index = string.find(close_string)
-        string = string[close_index+2:]
+        clean_pieces.append("✂")
+        if offsets is not None:
+            clean_offsets.append(offsets[position])
+        position = close_index + 2
+        close_index = string.find(close_string, position)
         nesting_depth -= 1
 
     # Note: if close_string is in string and nesting_depth == 0,
     # close_string gets included in the output string due to
     # imbalance (too many close_string)
-    return string_clean + string
+    clean_pieces.append(string[position:])
+    if offsets is None:
+        return ("".join(clean_pieces), None)
+    clean_offsets.extend(offsets[position:])
+    return ("".join(clean_pieces), clean_offsets)
 
 
 # These have to happen before templates are stripped out.
@@ -463,6 +538,332 @@ substitutions_bold_italics = [
 ]
 
 
+# -- Substitution steps --
+
+# The substitution lists above are applied in order, but to save
+# rescanning the article for each one, they're compiled into steps:
+#  * Runs of rules that replace plain literal strings are merged into
+#    one regex alternation, applied in one pass.  If that leaves
+#    anything the run would match (a replacement or deletion made a
+#    new match, which one rule at a time might have replaced), the run
+#    is redone one rule at a time, so output is always the same.
+#  * Runs of other rules that can only match text containing the same
+#    character (like "<" or "&") share a check that it's in the text.
+#
+# Steps are (trigger character or None, merged regex or None,
+# replacements by group number, rules).
+
+literal_pattern_re = re.compile(r"^(?:[^.^$*+?\[\]\\|(){]|\{(?!\d*,?\d*\}))+$")
+regex_special_characters = ".^$*+?{}[]\\|()"
+
+
+def is_literal_rule(regex, replacement):
+    return (isinstance(replacement, str)
+            and "\\" not in replacement
+            and not regex.flags & ~(re.I | re.S | re.U)
+            and literal_pattern_re.match(regex.pattern) is not None)
+
+
+# True if a match of one literal rule could contain or overlap a match
+# of the other, so merging them might change which gets replaced
+def literals_overlap(first_regex, second_regex):
+    (first, second) = (first_regex.pattern, second_regex.pattern)
+    if (first_regex.flags | second_regex.flags) & re.I:
+        (first, second) = (first.lower(), second.lower())
+    if first in second or second in first:
+        return True
+    for length in range(1, min(len(first), len(second))):
+        if first.endswith(second[:length]) or second.endswith(first[:length]):
+            return True
+    return False
+
+
+quantifier_re = re.compile(r"(?:[*+?]|\{(\d*),?\d*\})[?+]?")
+
+
+def skip_character_class(pattern, position):
+    position += 1
+    if pattern[position:position + 1] == "^":
+        position += 1
+    if pattern[position:position + 1] == "]":
+        position += 1
+    while position < len(pattern) and pattern[position] != "]":
+        position += 2 if pattern[position] == "\\" else 1
+    return position + 1
+
+
+def skip_group(pattern, position):
+    depth = 0
+    while position < len(pattern):
+        character = pattern[position]
+        if character == "\\":
+            position += 2
+            continue
+        if character == "[":
+            position = skip_character_class(pattern, position)
+            continue
+        if character == "(":
+            depth += 1
+        elif character == ")":
+            depth -= 1
+            if depth == 0:
+                return position + 1
+        position += 1
+    return position
+
+
+# Returns a character that must be in any text regex matches (a
+# top-level literal that can't be repeated zero times), or None
+def get_trigger_character(regex):
+    if regex.flags & re.X:
+        return None
+    pattern = regex.pattern
+    trigger = None
+    position = 0
+    while position < len(pattern):
+        character = pattern[position]
+        literal = None
+        if character == "\\":
+            escape = pattern[position + 1:position + 2]
+            if escape == "n":
+                literal = "\n"
+            elif escape and not escape.isalnum():
+                literal = escape
+            position += 2
+        elif character == "[":
+            position = skip_character_class(pattern, position)
+        elif character == "(":
+            position = skip_group(pattern, position)
+        elif character == "|":
+            # Nothing is required if there's a top-level alternative
+            return None
+        else:
+            if character not in ".^$":
+                literal = character
+            position += 1
+
+        quantifier_match = quantifier_re.match(pattern, position)
+        if quantifier_match:
+            position = quantifier_match.end()
+            quantifier = quantifier_match.group()
+            if quantifier[0] in "*?" or (quantifier[0] == "{" and not int(quantifier_match.group(1) or 0)):
+                literal = None
+
+        # Case-insensitive matching of letters includes some non-ASCII
+        # letters (like "ſ" for "s"), so only use other characters
+        if regex.flags & re.I and literal and (literal.isalpha() or not literal.isascii()):
+            literal = None
+        if trigger is None:
+            trigger = literal
+    return trigger
+
+
+# Returns the start shared by all the rules' literals, up to the first
+# character that has case.  The merged regex starts with it, outside
+# any case-insensitive group, so the regex engine can skip ahead to
+# where it occurs instead of trying every alternative everywhere.
+def get_literal_prefix(rules):
+    prefix = os.path.commonprefix([regex.pattern for (regex, replacement) in rules])
+    for (index, character) in enumerate(prefix):
+        if character.lower() != character.upper():
+            return prefix[:index]
+    return prefix
+
+
+def make_literal_step(rules):
+    if len(rules) == 1:
+        (regex, replacement) = rules[0]
+        return (get_trigger_character(regex), None, None, rules)
+    prefix = get_literal_prefix(rules)
+    alternatives = []
+    for (regex, replacement) in rules:
+        alternative = re.escape(regex.pattern[len(prefix):])
+        if regex.flags & re.I:
+            alternative = f"(?i:{alternative})"
+        alternatives.append(f"({alternative})")
+    merged_regex = re.compile(re.escape(prefix) + "(?:" + "|".join(alternatives) + ")")
+    replacements = [None] + [replacement for (regex, replacement) in rules]
+    return (get_trigger_character(rules[0][0]), merged_regex, replacements, rules)
+
+
+def compile_substitution_steps(rules):
+    steps = []
+    literal_rules = []
+    for (regex, replacement) in rules:
+        if is_literal_rule(regex, replacement):
+            if literal_rules and (not get_literal_prefix(literal_rules + [(regex, replacement)])
+                                  or any(literals_overlap(regex, literal_regex) for (literal_regex, _) in literal_rules
+                                         if literal_regex.pattern != regex.pattern)):
+                steps.append(make_literal_step(literal_rules))
+                literal_rules = []
+            literal_rules.append((regex, replacement))
+            continue
+        if literal_rules:
+            steps.append(make_literal_step(literal_rules))
+            literal_rules = []
+        trigger = get_trigger_character(regex)
+        if trigger and steps and steps[-1][0] == trigger and not steps[-1][1]:
+            steps[-1][3].append((regex, replacement))
+        else:
+            steps.append((trigger, None, None, [(regex, replacement)]))
+    if literal_rules:
+        steps.append(make_literal_step(literal_rules))
+    return steps
+
+
+def apply_substitution_steps(steps, string, offsets):
+    for (trigger, merged_regex, replacements, rules) in steps:
+        if trigger and trigger not in string:
+            continue
+        if merged_regex:
+            (new_string, new_offsets) = substitute_with_offsets(
+                merged_regex, lambda match: replacements[match.lastindex], string, offsets)
+            if not merged_regex.search(new_string):
+                (string, offsets) = (new_string, new_offsets)
+                continue
+        for (regex, replacement) in rules:
+            (string, offsets) = substitute_with_offsets(regex, replacement, string, offsets)
+    return (string, offsets)
+
+
+early_substitution_steps = compile_substitution_steps(early_substitutions)
+substitution_steps = compile_substitution_steps(substitutions)
+substitution_sub_sup_steps = compile_substitution_steps(substitutions_sub_sup)
+
+
+# -- Leftover markup --
+
+# For checking plain text for markup that should have been removed
+# along with its partner (like "{{" without "}}"), which usually means
+# a typo in the wikitext or something moss doesn't parse.
+
+# Returns a dict of the number of times each of markers occurs in
+# string.  (str.count() makes a pass per marker, but in C; a single
+# regex alternation over all of them was slower.)
+def count_markup(string, markers):
+    return {marker: string.count(marker) for marker in markers}
+
+
+markup_excerpt_res = {}
+
+
+# Returns each occurrence of marker in string with up to
+# context_length characters on either side, stopping at line breaks
+def get_markup_excerpts(string, marker, context_length=20):
+    excerpt_re = markup_excerpt_res.get((marker, context_length))
+    if not excerpt_re:
+        excerpt_re = re.compile(r".{0,%d}%s.{0,%d}" % (context_length, re.escape(marker), context_length))
+        markup_excerpt_res[(marker, context_length)] = excerpt_re
+    return excerpt_re.findall(string)
+
+
+# -- Caching of derived text --
+
+# Set to a dict by moss_dump_analyzer.run_registered_checks() while
+# several checks are looking at the same article, so that derived
+# text is only computed once per article instead of once per check.
+# None (the default) disables caching.
+derived_text_cache = None
+
+# To also cache derived text on disk, keyed by a hash of the input
+# text, set MOSS_TEXT_CACHE to the name of an SQLite file, for
+# example:
+#  export MOSS_TEXT_CACHE=/var/local/moss/bulk-wikipedia/enwiki-derived-text.sqlite
+# Later reports in the same run, and unchanged articles in the next
+# dump, then skip the regex cleanup entirely.  Any change to this file
+# (including the substitution tables) invalidates the whole cache.
+# Plan on disk space comparable to the article CSV.
+DERIVED_TEXT_DB_FILE = os.environ.get("MOSS_TEXT_CACHE")
+DERIVED_TEXT_DB_BATCH_SIZE = 1000
+
+derived_text_db = None
+derived_text_db_pid = None
+derived_text_db_pending = {}
+
+
+def get_derived_text_version():
+    with open(__file__, "rb") as source_file:
+        return hashlib.sha1(source_file.read()).hexdigest()
+
+
+def get_derived_text_db():
+    global derived_text_db
+    global derived_text_db_pid
+
+    # SQLite connections can't be shared with forked child processes
+    if derived_text_db is not None and derived_text_db_pid == os.getpid():
+        return derived_text_db
+    derived_text_db_pending.clear()
+
+    version = get_derived_text_version()
+    db = sqlite3.connect(DERIVED_TEXT_DB_FILE, timeout=300)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=OFF")
+    db.execute("CREATE TABLE IF NOT EXISTS derived_text ("
+               " content_hash BLOB NOT NULL,"
+               " kind TEXT NOT NULL,"
+               " derived_text TEXT NOT NULL,"
+               " PRIMARY KEY (content_hash, kind)) WITHOUT ROWID")
+    db.execute("CREATE TABLE IF NOT EXISTS cache_version (version TEXT NOT NULL)")
+    row = db.execute("SELECT version FROM cache_version").fetchone()
+    if not row or row[0] != version:
+        with db:
+            db.execute("DELETE FROM derived_text")
+            db.execute("DELETE FROM cache_version")
+            db.execute("INSERT INTO cache_version (version) VALUES (?)", (version,))
+
+    derived_text_db = db
+    derived_text_db_pid = os.getpid()
+    return db
+
+
+# Writes are batched so parallel processes don't spend their time
+# waiting for each other's write locks.
+def flush_derived_text_db():
+    if not derived_text_db_pending or derived_text_db_pid != os.getpid():
+        return
+    with derived_text_db:
+        derived_text_db.executemany("INSERT OR REPLACE INTO derived_text (content_hash, kind, derived_text) VALUES (?, ?, ?)",
+                                    [(content_hash, kind, derived) for ((content_hash, kind), derived) in derived_text_db_pending.items()])
+    derived_text_db_pending.clear()
+
+
+atexit.register(flush_derived_text_db)
+
+
+# kind must identify both the conversion and any options that change
+# its output.
+def get_derived_text(kind, string, impl_function, *args):
+    if derived_text_cache is None and not DERIVED_TEXT_DB_FILE:
+        return impl_function(string, *args)
+
+    if derived_text_cache is not None:
+        cache_key = (kind, string)
+        if cache_key in derived_text_cache:
+            return derived_text_cache[cache_key]
+
+    derived = None
+    if DERIVED_TEXT_DB_FILE:
+        db = get_derived_text_db()
+        db_key = (hashlib.blake2b(string.encode("utf-8"), digest_size=16).digest(), kind)
+        derived = derived_text_db_pending.get(db_key)
+        if derived is None:
+            row = db.execute("SELECT derived_text FROM derived_text WHERE content_hash = ? AND kind = ?", db_key).fetchone()
+            if row:
+                derived = row[0]
+
+    if derived is None:
+        derived = impl_function(string, *args)
+        if DERIVED_TEXT_DB_FILE:
+            derived_text_db_pending[db_key] = derived
+            if len(derived_text_db_pending) >= DERIVED_TEXT_DB_BATCH_SIZE:
+                flush_derived_text_db()
+
+    if derived_text_cache is not None:
+        derived_text_cache[cache_key] = derived
+    return derived
+
+
 # This function does not preserve all elements in the wikitext where
 # non-linear rendering or template substitution would be required, so
 # some information on the page is lost.  It is intended for use with
@@ -470,25 +871,36 @@ substitutions_bold_italics = [
 # leave complicated markup (including math-in-prose) unverified.  Some
 # wikitext features, like section headers, are left intact.
 def wikitext_to_plaintext(string, flatten_sup_sub=True):
-    for (regex, replacement) in early_substitutions:
-        string = regex.sub(replacement, string)
+    return get_derived_text(f"plaintext:{flatten_sup_sub}", string, _wikitext_to_plaintext_impl, flatten_sup_sub)
+
+
+# Returns (plaintext, offset map from plaintext to string).  Slower,
+# and not cached.
+def wikitext_to_plaintext_with_offsets(string, flatten_sup_sub=True):
+    return _wikitext_to_plaintext_offsets_impl(string, flatten_sup_sub, make_offset_map(string))
+
+
+def _wikitext_to_plaintext_impl(string, flatten_sup_sub):
+    return _wikitext_to_plaintext_offsets_impl(string, flatten_sup_sub, None)[0]
+
+
+def _wikitext_to_plaintext_offsets_impl(string, flatten_sup_sub, offsets):
+    (string, offsets) = apply_substitution_steps(early_substitution_steps, string, offsets)
 
     # TODO: Spell check visible contents of these special constructs
-    string = remove_structure_nested(string, "{{", "}}")
-    string = remove_structure_nested(string, "{|", "|}")
+    (string, offsets) = remove_structure_nested_with_offsets(string, "{{", "}}", offsets)
+    (string, offsets) = remove_structure_nested_with_offsets(string, "{|", "|}", offsets)
 
     # We see some cases where the {| is in a template and the |} is in
     # the article.
-    string = remove_structure_nested(string, "|-", "|}")
+    (string, offsets) = remove_structure_nested_with_offsets(string, "|-", "|}", offsets)
 
-    for (regex, replacement) in substitutions:
-        string = regex.sub(replacement, string)
+    (string, offsets) = apply_substitution_steps(substitution_steps, string, offsets)
 
     if flatten_sup_sub:
-        for (regex, replacement) in substitutions_sub_sup:
-            string = regex.sub(replacement, string)
+        (string, offsets) = apply_substitution_steps(substitution_sub_sup_steps, string, offsets)
 
-    return string
+    return (string, offsets)
 
 
 contractions_alternation = "|".join(contractions)
@@ -522,8 +934,8 @@ ignore_sections_re = re.compile(
     r"==\s*Compositions\s*==|"
     r"==\s*Recordings\s*=="
     r"==\s*Track listing\s*=="
-    r").*$",
-    flags=re.I + re.S)
+    r")",
+    flags=re.I)
 ignore_headers_re = re.compile("=[^\n]+=\n")
 ignore_lists_re = re.compile(r"\n[\*\#;][^\n]*")
 line_starts_with_re = re.compile(r"\n[ :†][^\n]*")
@@ -534,33 +946,59 @@ wikt_line_starts_with_re = re.compile(r"\n#\*[^\n]*")
 # Quotations, often with archaic spelling
 
 
-def get_main_body_wikitext(wikitext_input, ignore_nonprose=False, include_quotations=False):
-    # Ignore non-prose and segments not parsed for grammar, spelling, etc.
+# Views of the main body that callers can ask for, as
+# (ignore_nonprose, include_quotations):
+#  "no_quotations" - prose and lists, without quotations
+#  "with_quotations" - prose, lists and quotations
+#  "prose" - prose only (no lists, parentheticals or quotations)
+#  "prose_with_quotations" - prose and quotations
+main_body_views = {
+    "no_quotations": (False, False),
+    "with_quotations": (False, True),
+    "prose": (True, False),
+    "prose_with_quotations": (True, True),
+}
+main_body_view_names = {flags: view for (view, flags) in main_body_views.items()}
+
 
+# Returns the main body of an article (an opaque value to pass to the
+# other functions), which ends at the first of ignore_sections_re.
+# Views of it are computed only when asked for, and kept, so asking
+# for several views of one article shares the work.  offsets is an
+# offset map for wikitext_input (see make_offset_map()) or None.
+def parse_main_body(wikitext_input, offsets=None):
     # TODO: Get smarter about these sections.  But for now, ignore
     # them, since they are full of proper nouns and URL words.
-    wikitext_working = ignore_sections_re.sub("", wikitext_input)
-
+    section_match = ignore_sections_re.search(wikitext_input)
+    if section_match:
+        section_start = section_match.start()
+        if offsets is not None:
+            offsets = offsets[:section_start] + offsets[len(wikitext_input):]
+        wikitext_input = wikitext_input[:section_start]
+    return {"text": wikitext_input, "offsets": offsets, "views": {}}
+
+
+# Steps shared by all views with the same include_quotations
+def get_main_body_common(main_body, include_quotations):
+    key = ("common", include_quotations)
+    if key in main_body["views"]:
+        return main_body["views"][key]
+
+    (wikitext_working, offsets) = (main_body["text"], main_body["offsets"])
     if not include_quotations:
-        wikitext_working = prose_quote_re.sub("✂", wikitext_working)
-        wikitext_working = prose_quote_curly_re.sub("✂", wikitext_working)
-        wikitext_working = bold_italics_re.sub(r"\1✂\3", wikitext_working)
-        wikitext_working = italics_re.sub(r"\1✂\3", wikitext_working)
-        wikitext_working = single_quote_re.sub(r"\1✂\3", wikitext_working)
-        wikitext_working = blockquote_re.sub("✂", wikitext_working)
-    wikitext_working = ignore_headers_re.sub("", wikitext_working)
-    wikitext_working = line_starts_with_re.sub("", wikitext_working)
+        for (regex, replacement) in [(prose_quote_re, "✂"),
+                                     (prose_quote_curly_re, "✂"),
+                                     (bold_italics_re, r"\1✂\3"),
+                                     (italics_re, r"\1✂\3"),
+                                     (single_quote_re, r"\1✂\3"),
+                                     (blockquote_re, "✂")]:
+            (wikitext_working, offsets) = substitute_with_offsets(regex, replacement, wikitext_working, offsets)
+    (wikitext_working, offsets) = substitute_with_offsets(ignore_headers_re, "", wikitext_working, offsets)
+    (wikitext_working, offsets) = substitute_with_offsets(line_starts_with_re, "", wikitext_working, offsets)
 
     # Must be done after italics_re
     for (regex, replacement) in substitutions_bold_italics:
-        wikitext_working = regex.sub(replacement, wikitext_working)
-
-    if ignore_nonprose:
-        wikitext_working = parenthetical_re.sub("", wikitext_working)
-        wikitext_working = ignore_lists_re.sub("", wikitext_working)
-
-    if not include_quotations:
-        wikitext_working = wikt_line_starts_with_re.sub("", wikitext_working)
+        (wikitext_working, offsets) = substitute_with_offsets(regex, replacement, wikitext_working, offsets)
 
     """
     # TODO: Do the same thing for italics and single quote
@@ -589,4 +1027,64 @@ def get_main_body_wikitext(wikitext_input, ignore_nonprose=False, include_quotat
         #  [[Zachery Kouwe]] - appropriat[ing]
     """
 
-    return wikitext_working
+    main_body["views"][key] = (wikitext_working, offsets)
+    return (wikitext_working, offsets)
+
+
+# Returns (text, offset map or None) for a view in main_body_views
+def get_main_body_view(main_body, view="no_quotations"):
+    if view in main_body["views"]:
+        return main_body["views"][view]
+
+    # Ignore non-prose and segments not parsed for grammar, spelling, etc.
+    (ignore_nonprose, include_quotations) = main_body_views[view]
+    (wikitext_working, offsets) = get_main_body_common(main_body, include_quotations)
+
+    if ignore_nonprose:
+        (wikitext_working, offsets) = substitute_with_offsets(parenthetical_re, "", wikitext_working, offsets)
+        (wikitext_working, offsets) = substitute_with_offsets(ignore_lists_re, "", wikitext_working, offsets)
+
+    if not include_quotations:
+        (wikitext_working, offsets) = substitute_with_offsets(wikt_line_starts_with_re, "", wikitext_working, offsets)
+
+    main_body["views"][view] = (wikitext_working, offsets)
+    return (wikitext_working, offsets)
+
+
+# Returns the lines of a view, for callers that go a paragraph at a time
+def get_main_body_paragraphs(main_body, view="no_quotations"):
+    key = ("paragraphs", view)
+    if key not in main_body["views"]:
+        main_body["views"][key] = get_main_body_view(main_body, view)[0].split("\n")
+    return main_body["views"][key]
+
+
+def get_main_body_wikitext(wikitext_input, ignore_nonprose=False, include_quotations=False):
+    return get_derived_text(f"main_body:{ignore_nonprose}:{include_quotations}",
+                            wikitext_input,
+                            _get_main_body_wikitext_impl,
+                            ignore_nonprose,
+                            include_quotations)
+
+
+# Like get_main_body_paragraphs(parse_main_body(wikitext_input), view),
+# but cached by get_derived_text() (under the same keys as
+# get_main_body_wikitext())
+def get_main_body_view_paragraphs(wikitext_input, view="no_quotations"):
+    (ignore_nonprose, include_quotations) = main_body_views[view]
+    return get_main_body_wikitext(wikitext_input, ignore_nonprose, include_quotations).split("\n")
+
+
+# Like get_main_body_wikitext(), but takes and returns an offset map
+# (see make_offset_map()) along with the text.  Not cached.
+def get_main_body_wikitext_with_offsets(wikitext_input, offsets, ignore_nonprose=False, include_quotations=False):
+    return _get_main_body_wikitext_offsets_impl(wikitext_input, offsets, ignore_nonprose, include_quotations)
+
+
+def _get_main_body_wikitext_impl(wikitext_input, ignore_nonprose, include_quotations):
+    return _get_main_body_wikitext_offsets_impl(wikitext_input, None, ignore_nonprose, include_quotations)[0]
+
+
+def _get_main_body_wikitext_offsets_impl(wikitext_input, offsets, ignore_nonprose, include_quotations):
+    view = main_body_view_names[(bool(ignore_nonprose), bool(include_quotations))]
+    return get_main_body_view(parse_main_body(wikitext_input, offsets), view)
@@ -45,13 +45,19 @@ import unicodedata
 os.environ["NO_LOAD"] = "1"
 
 try:
+    from lexicon_file import word_set_contains
+    from lexicons import get_lexicon, get_suggestion_index
+    from suggestion_index import get_suggestion_candidates
     from sectionalizer import get_word
-    from spell import bad_characters
+    from spell import has_bad_characters
     from spell import bad_words
     from wikitext_util import html_tag_re
 except ImportError:
+    from .lexicon_file import word_set_contains
+    from .lexicons import get_lexicon, get_suggestion_index
+    from .suggestion_index import get_suggestion_candidates
     from .sectionalizer import get_word
-    from .spell import bad_characters
+    from .spell import has_bad_characters
     from .spell import bad_words
     from .wikitext_util import html_tag_re
 
@@ -82,7 +88,8 @@ not_html = {"<a>", "<name>", "<r>", "<h>"}
 # Edit distance 4 and greater gives a negligible true positive rate
 # Though even 2 and 3 are more non-typos than typos, especially if
 # using a full dictionary.  Need to use other methods to classify
-# those.
+# those.  (The suggestion index supports up to
+# lexicons.SUGGESTION_MAX_EDIT_DISTANCE.)
 MAX_EDIT_DISTANCE = 1
 
 
@@ -181,6 +188,8 @@ def make_suggestion_helper(word):
     return (word, sets_for_word)
 
 
+# In-memory version of suggestion_index.py, which load_data() now
+# uses instead
 def make_suggestion_dict(input_list):
 
     # Takes about 4.5 min in parallel, 10 min serial at MAX_EDIT_DISTANCE 3
@@ -428,64 +437,34 @@ def is_english_compound(word, english_words):
 
     parts = word.split("-")
     if len(parts) > 1:
-        if all(part in english_words for part in parts):
+        if all(word_set_contains(english_words, part) for part in parts):
             return True
         return False
 
     pairs = [(word[0:i], word[i:]) for i in range(1, len(word))]
     for pair in pairs:
-        if pair[0] in english_words and pair[1] in english_words:
+        if word_set_contains(english_words, pair[0]) and word_set_contains(english_words, pair[1]):
             return True
     return False
 
 
 # -- Spelling suggestions and T_ code --
 
-# Process the input word into low-fi match strings
-def get_anychar_permutations(word):
-    word = word.lower()
-    permus = [word]
-    working_list = [word]
-    for num_any in range(1, MAX_EDIT_DISTANCE + 1):
-        new_permus = []
-        for wrd in working_list:
-            new_permus.extend([wrd[0:c] + "*" + wrd[c + 1:] for c in range(0, len(wrd))])
-        permus.extend(new_permus)
-        working_list = new_permus
-    return permus
-
-
 # Returns (False) if not near a known English word, or (integer edit
 # distance, spelling suggestion) to closest word up to
 # MAX_EDIT_DISTANCE
-def near_common_word(word, english_words, suggestion_dict):
+def near_common_word(word, english_words, suggestion_index):
     word = word.lower()
-    if word in english_words:
+    if word_set_contains(english_words, word):
         return 0
 
-    lowfi_strings = {make_lowfi_string(permu) for permu in get_anychar_permutations(word)}
-    # PERFORMANCE NOTE: Can be made more efficient by doing equivalent
-    # of get_anychar_permutations() knowing we only care about lowfi
-    # strings
-
     matches_by_distance = defaultdict(set)
+    for match in get_suggestion_candidates(suggestion_index, word, MAX_EDIT_DISTANCE):
+        matches_by_distance[distance.edit_distance(word, match, transpositions=True)].add(match)
     for edit_distance in range(1, MAX_EDIT_DISTANCE + 1):
-        matches = []  # List to avoid excessive de-dup comparisons
-        for lowfi_string in lowfi_strings:
-            if lowfi_string in suggestion_dict[edit_distance]:
-                matches.extend(list(suggestion_dict[edit_distance][lowfi_string]))
-        matches = {match for match in matches if abs(len(match) - len(word)) <= MAX_EDIT_DISTANCE}
-        if edit_distance > 1:
-            # A little lossy, but greatly improves performance
-            matches = {match for match in matches if match[0] == word[0]}
-
-        for match in matches:
-            matches_by_distance[distance.edit_distance(word, match, transpositions=True)].add(match)
         if matches_by_distance[edit_distance]:
-            return (edit_distance, list(matches_by_distance[edit_distance])[0])
-        # Intentionally leaving matches_by_distance of higher edit
-        # distance (if any) for the next loop, so all suggestions of
-        # equal distance will show up
+            # All suggestions of equal distance are equally good
+            return (edit_distance, min(matches_by_distance[edit_distance]))
     return (False, False)
 
 
@@ -519,7 +498,7 @@ def get_word_category(word):
     global english_words
     global titles_all_wiktionaries
     global transliterations
-    global suggestion_dict
+    global suggestion_index
 
     category = None
     suggestion = None
@@ -530,7 +509,7 @@ def get_word_category(word):
     if word in bad_words:
         # "I'm"
         return "BW"
-    if any([bad_char in word for bad_char in bad_characters]):
+    if has_bad_characters(word):
         # (bad character or substring)
         return "BC"
 
@@ -554,7 +533,7 @@ def get_word_category(word):
     #
     # TODO: Find the language of the word by Wikitionary lookup
     # instead of fuzzy language identification.
-    if word in titles_all_wiktionaries:
+    if word_set_contains(titles_all_wiktionaries, word):
         return tag_by_lang(word)
 
     if is_url_or_filename(word):
@@ -565,8 +544,8 @@ def get_word_category(word):
         category = "TS"
     elif az_plus_re.match(word):
         if az_re.match(word):
-            (edit_distance, suggestion) = near_common_word(word, english_words, suggestion_dict)
-            if word in transliterations:
+            (edit_distance, suggestion) = near_common_word(word, english_words, suggestion_index)
+            if word_set_contains(transliterations, word):
                 category = "L"
             elif is_rhyme_scheme(word):
                 category = "P"
@@ -636,7 +615,7 @@ def param_generator():
         yield (line.strip())
 
 
-# def process_input_parallel(english_words, titles_all_wiktionaries, transliterations, suggestion_dict):
+# def process_input_parallel(english_words, titles_all_wiktionaries, transliterations, suggestion_index):
 def process_input_parallel():
     # maxtasksperchild=10000 for garbage collection
     # chunksize=1000 for marshalling speed
@@ -654,24 +633,20 @@ def load_data():
     global titles_all_wiktionaries
     global transliterations
     global english_words
-    global suggestion_dict
+    global suggestion_index
 
     # Any words in multi-word phrases should also be listed as individual
     # words, so don't bother tokenizing.  TODO: Drop multi-word phrases
     # (at list creation time?) since these won't be matched anyway.
     print(datetime.datetime.now(), file=sys.stderr)
     print("Loading all languages...", file=sys.stderr)
-    with open("/var/local/moss/bulk-wikipedia/titles_all_wiktionaries_uniq.txt", "r") as title_list:
-        titles_all_wiktionaries = set([line.strip() for line in title_list])
+    titles_all_wiktionaries = get_lexicon("all_wiktionaries")
 
     print("Loading transliterations...", file=sys.stderr)
-    with open("/var/local/moss/bulk-wikipedia/transliterations.txt", "r") as title_list:
-        transliterations = set([line.strip().split("\t")[1] for line in title_list
-                                if "\t" in line.strip() and "_" not in line])
+    transliterations = get_lexicon("transliterations")
 
     print("Loading English words only...", file=sys.stderr)
-    with open("/var/local/moss/bulk-wikipedia/english_words_only.txt", "r") as title_list:
-        english_words = set([line.strip() for line in title_list])
+    english_words = get_lexicon("english_words")
 
     """
     global english_words_by_length_and_letter
@@ -687,8 +662,8 @@ def load_data():
     """
 
     print(datetime.datetime.now(), file=sys.stderr)
-    print("Indexing English spelling suggestions...", file=sys.stderr)
-    suggestion_dict = make_suggestion_dict([w for w in english_words if az_re.match(w)])
+    print("Loading English spelling suggestions...", file=sys.stderr)
+    suggestion_index = get_suggestion_index()
 
     print("Done loading.", file=sys.stderr)
     print(datetime.datetime.now(), file=sys.stderr)
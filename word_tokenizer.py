@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# Splits plain text (from wikitext_util.wikitext_to_plaintext()) into
+# words for spell checking, in one pass with one regex.
+#
+# Mostly follows nltk.word_tokenize(), which moss_spell_check.py used
+# to use, but keeps these as single tokens instead of needing them to
+# be glued back together afterwards:
+#  HTML entities: "&amp;", "&#160;" (but not the "&T;" in "AT&T;")
+#  HTML tags without attributes: "<br/>", "</b>"
+#  Transliterations from Arabic script using U+2019 (right single
+#   quote mark) for 'ayn or hamza: "Pā’īn"
+#  Acronyms with a final period: "U.S."
+#  Leading asterisks, as on unattested forms: "*tuqlid"
+#
+# Like NLTK, contractions are split ("don't" -> "do", "n't"), and so
+# are final periods except after acronyms.  Unlike NLTK, a final
+# period is split off whether or not it ends a sentence, unless the
+# caller's keep_period() accepts the token with its period (as
+# moss_spell_check.py does for dictionary words like "approx." and
+# "etc.").  Em dashes are treated as whitespace.
+
+import re
+
+# Split off as separate tokens, as in NLTK.  (Double quotes included
+# for completeness; moss_spell_check.py rejects articles with
+# unmatched ones before tokenizing.)
+SEPARATE_CHARS = ",;:()\\[\\]{}<>?!$%@#&*‘’“”«»\"`"
+
+token_re = re.compile(
+    r"(?P<entity>&#\w+;|(?<![A-Z])&\w+;|&(?![A-Z]+s?;)\w+;)"
+    r"|(?P<tag><[^\s" + SEPARATE_CHARS + r"]+>)"
+    r"|(?P<transliteration>(?:[^\W\d_]|-)+’(?:[^\W\d_]|-)+(?![^\s—" + SEPARATE_CHARS + r".]))"
+    # Commas and colons are part of words only before a digit, as in
+    # "1,000" and "10:30"
+    r"|(?P<word>(?:(?<![^\s—" + SEPARATE_CHARS + r"])\*+)?(?:[^\s—" + SEPARATE_CHARS + r"]|[,:](?=\d))+)"
+    r"|(?P<separate>[" + SEPARATE_CHARS + r"])")
+
+contraction_re = re.compile(r"(n't|'s|'m|'d|'ll|'re|'ve)$", flags=re.I)
+
+
+# Returns a list of (token, offset of token in text)
+def tokenize_with_offsets(text, keep_period=None):
+    tokens = []
+    for match in token_re.finditer(text):
+        token = match.group()
+        offset = match.start()
+        if match.lastgroup != "word":
+            tokens.append((token, offset))
+            continue
+
+        periods = ""
+        if token.endswith(".") and not (keep_period and keep_period(token)):
+            stem = token.rstrip(".")
+            if "." not in stem or token[-2] == ".":
+                periods = token[len(stem):]
+                token = stem
+
+        if "'" in token:
+            contraction_match = contraction_re.search(token, 1)
+            if contraction_match:
+                tokens.append((token[:contraction_match.start()], offset))
+                token = contraction_match.group()
+                offset += contraction_match.start()
+
+        if token:
+            tokens.append((token, offset))
+        if periods:
+            tokens.append((periods, offset + len(token)))
+    return tokens
+
+
+def tokenize(text):
+    return [token for (token, offset) in tokenize_with_offsets(text)]
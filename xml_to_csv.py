@@ -2,53 +2,211 @@
 
 # Usage:
 #  cat enwiki-latest-pages-articles-multistream.xml | venv/bin/python3 xml_to_csv.py enwiki
+# or, to decompress and convert in parallel using the multistream index:
+#  venv/bin/python3 xml_to_csv.py enwiki enwiki-latest-pages-articles-multistream.xml.bz2 enwiki-latest-pages-articles-multistream-index.txt.bz2
 #
 # This script will create 2 CSV files (one with articles and one with
-# redirects) named starting with the specified base name.
+# redirects) named starting with the specified base name, plus an
+# index of the article CSV giving the byte offset and length, revision
+# ID, and SHA-1 of each article record (used by moss_dump_analyzer to
+# read the article CSV in parallel shards and to skip articles that
+# haven't changed since a previous run).
+#
+# It also writes the same articles to a compressed container (.zst)
+# with its own index (.zst.idx); see CONTAINER_SUFFIX in
+# moss_dump_analyzer.py for the format.  moss_dump_analyzer reads
+# either one.
 
 # Files come from:
 #  http://dumps.wikimedia.org/backup-index.html
 # XML format info:
 #  http://meta.wikimedia.org/wiki/Data_dumps
+# Multistream format info:
+#  https://meta.wikimedia.org/wiki/Data_dumps/Dump_format#Multistream_dumps
 
+import bz2
+import io
 import lxml.etree
+import multiprocessing
 import re
 import sys
+import zstandard
+from moss_dump_analyzer import CONTAINER_FRAME_HEADER, CONTAINER_RECORD_HEADER
 
 PAGE_RE = re.compile(r"^.*(<page.*?</page>).*$", flags=re.MULTILINE+re.DOTALL)
 NEWLINE_RE = re.compile(r"\n")
 
+# Streams are about 100 pages each
+STREAMS_PER_TASK = 16
+
+# Uncompressed size of container frames; each shard read by
+# moss_dump_analyzer starts at a frame boundary.
+CONTAINER_FRAME_SIZE = 1024 * 1024
+CONTAINER_COMPRESSION_LEVEL = 3
+
+container_compressor = zstandard.ZstdCompressor(level=CONTAINER_COMPRESSION_LEVEL)
+container_offset = 0
+frame_records = []
+frame_index_lines = []
+frame_size = 0
+
+
+# Returns a list of (article_title, title_bytes, text_bytes,
+# revision_id, sha1) for the articles in page_elements, and the
+# redirect CSV lines as a string
+def convert_pages(page_elements):
+    articles = []
+    redirect_lines = []
+
+    for page_element in page_elements:
+        namespace = page_element.findtext('ns')
+        if namespace != '0':
+            # Page is not an article
+            page_element.clear()
+            continue
+
+        article_title = page_element.findtext('title')
+        redirect_element = page_element.find('redirect')
+        if redirect_element is not None:
+            redirect_target = redirect_element.get("title")
+            if not redirect_target:
+                raise Exception(f"{article_title}: missing redirect target")
+            redirect_lines.append(f"{article_title}\t{redirect_target}\n")
+        else:
+            article_text = page_element.findtext('.//text')
+            revision_id = page_element.findtext('revision/id')
+            sha1 = page_element.findtext('revision/sha1')
+            articles.append((article_title, article_title.encode("utf-8"), str(article_text).encode("utf-8"), revision_id, sha1))
+        page_element.clear()
+
+    return (articles, "".join(redirect_lines))
+
+
+# Returns the new offset of the end of the article CSV
+def write_converted(converted, article_offset, article_file, index_file, redirect_file):
+    (articles, redirect_text) = converted
+    for (article_title, title_bytes, text_bytes, revision_id, sha1) in articles:
+        # Using linefeed as line separator to avoid
+        # conflicting with newlines in article_text
+        article_record = title_bytes + b"\t" + text_bytes + b"\r"
+        article_file.write(article_record)
+        print(f"{article_title}\t{article_offset}\t{len(article_record)}\t{revision_id}\t{sha1}", file=index_file)
+        article_offset += len(article_record)
+        add_to_container(article_title, title_bytes, text_bytes, revision_id, sha1)
+    redirect_file.write(redirect_text)
+    return article_offset
+
+
+def add_to_container(article_title, title_bytes, text_bytes, revision_id, sha1):
+    global frame_size
+    frame_records.append(CONTAINER_RECORD_HEADER.pack(len(title_bytes), len(text_bytes)))
+    frame_records.append(title_bytes)
+    frame_records.append(text_bytes)
+    frame_index_lines.append((article_title, revision_id, sha1))
+    frame_size += CONTAINER_RECORD_HEADER.size + len(title_bytes) + len(text_bytes)
+    if frame_size >= CONTAINER_FRAME_SIZE:
+        write_container_frame()
+
+
+def write_container_frame():
+    global container_offset
+    global frame_size
+    if not frame_records:
+        return
+    frame = container_compressor.compress(b"".join(frame_records))
+    container_file.write(CONTAINER_FRAME_HEADER.pack(len(frame)))
+    container_file.write(frame)
+    frame_length = CONTAINER_FRAME_HEADER.size + len(frame)
+    for (article_title, revision_id, sha1) in frame_index_lines:
+        print(f"{article_title}\t{container_offset}\t{frame_length}\t{revision_id}\t{sha1}", file=container_index_file)
+    container_offset += frame_length
+    frame_records.clear()
+    frame_index_lines.clear()
+    frame_size = 0
+
+
+def page_generator_stdin():
+    working_lines = []
+    for line in sys.stdin:
+        working_lines.append(line)
+        if line == "  </page>\n":
+            working_string = PAGE_RE.sub(r"\1", "".join(working_lines))
+            working_lines = []
+            yield lxml.etree.fromstring(working_string)
+
+
+# -- Parallel conversion of multistream dumps --
+
+# Each bz2 stream in a multistream dump can be decompressed on its
+# own; the index gives the byte offset of each stream (once per page).
+def get_stream_offsets(index_filename):
+    offsets = set()
+    with bz2.open(index_filename, "rt", encoding="utf-8") as index_file:
+        for line in index_file:
+            offsets.add(int(line.split(":", 1)[0]))
+    return sorted(offsets)
+
+
+def convert_streams(stream_range):
+    (bz2_filename, start_offset, end_offset) = stream_range
+    with open(bz2_filename, "rb") as bz2_file:
+        bz2_file.seek(start_offset)
+        if end_offset is None:
+            compressed = bz2_file.read()
+        else:
+            compressed = bz2_file.read(end_offset - start_offset)
+
+    # Decompress one stream at a time; the one after the last indexed
+    # stream only closes the <mediawiki> element.
+    xml_blocks = []
+    while compressed:
+        decompressor = bz2.BZ2Decompressor()
+        xml_blocks.append(decompressor.decompress(compressed))
+        compressed = decompressor.unused_data
+    xml = b"".join(xml_blocks)
+
+    first_page = xml.find(b"<page>")
+    if first_page == -1:
+        return ([], "")
+    xml = xml[first_page:xml.rfind(b"</page>") + len(b"</page>")]
+    pages = lxml.etree.iterparse(io.BytesIO(b"<pages>" + xml + b"</pages>"), tag="page")
+    return convert_pages(page_element for (event, page_element) in pages)
+
+
+def get_stream_ranges(bz2_filename, index_filename):
+    offsets = get_stream_offsets(index_filename)
+    task_offsets = offsets[::STREAMS_PER_TASK]
+    return [(bz2_filename, start_offset, end_offset)
+            for (start_offset, end_offset) in zip(task_offsets, task_offsets[1:] + [None])]
+
+
 if __name__ == '__main__':
     base_name = sys.argv[1]
     if not base_name:
         print("NO BASE NAME SPECIFIED")
         exit(1)
 
-    working_string = ""
-    article_file = open(f"{base_name}-articles-no-redir.csv", "w")
+    # Binary so byte offsets for the index are exact
+    article_file = open(f"{base_name}-articles-no-redir.csv", "wb")
+    index_file = open(f"{base_name}-articles-no-redir.idx", "w")
     redirect_file = open(f"{base_name}-redirects.csv", "w")
+    container_file = open(f"{base_name}-articles-no-redir.zst", "wb")
+    container_index_file = open(f"{base_name}-articles-no-redir.zst.idx", "w")
+    article_offset = 0
 
-    for line in sys.stdin:
-        working_string += line
-        if line == "  </page>\n":
-            working_string = PAGE_RE.sub(r"\1", working_string)
-            root_element = lxml.etree.fromstring(working_string)
-            working_string = ""
-
-            namespace = root_element.findtext('ns')
-            if namespace != '0':
-                # Page is not an article
-                continue
-
-            article_title = root_element.findtext('title')
-            redirect_element = root_element.find('redirect')
-            if redirect_element is not None:
-                redirect_target = redirect_element.get("title")
-                if not redirect_target:
-                    raise Exception(f"{article_title}: missing redirect target")
-                print(f"{article_title}\t{redirect_target}", file=redirect_file)
-            else:
-                article_text = root_element.findtext('.//text')
-                article_file.write(f"{article_title}\t{article_text}\r")
-                # Using linefeed as line separator to avoid
-                # conflicting with newlines in article_text
+    if len(sys.argv) > 2:
+        stream_ranges = get_stream_ranges(sys.argv[2], sys.argv[3])
+        with multiprocessing.Pool(multiprocessing.cpu_count()) as pool:
+            # imap keeps output in dump order
+            for converted in pool.imap(convert_streams, stream_ranges):
+                article_offset = write_converted(converted, article_offset, article_file, index_file, redirect_file)
+    else:
+        for page_element in page_generator_stdin():
+            article_offset = write_converted(convert_pages([page_element]), article_offset, article_file, index_file, redirect_file)
+
+    write_container_frame()
+    article_file.close()
+    index_file.close()
+    redirect_file.close()
+    container_file.close()
+    container_index_file.close()